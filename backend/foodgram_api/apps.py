@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class FoodgramApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'foodgram_api'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from recipes.models import Ingredient
+        from . import cache
+        from .search import ingredient_index
+
+        # Индекс поиска продуктов сбрасывается при их изменении
+        post_save.connect(
+            ingredient_index.invalidate, sender=Ingredient,
+            dispatch_uid='ingredient_index_save')
+        post_delete.connect(
+            ingredient_index.invalidate, sender=Ingredient,
+            dispatch_uid='ingredient_index_delete')
+
+        # Сброс кэша ответов при изменении рецептов и их авторов
+        cache.connect_signals(get_user_model())
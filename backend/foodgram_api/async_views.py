@@ -0,0 +1,124 @@
+"""
+Асинхронные представления для режима ASGI (воркеры uvicorn).
+
+В Django 3.2 нет асинхронного ORM, а синхронные представления под ASGI
+выполняются в одном общем потоке процесса, то есть по очереди.
+Поэтому представления чтения (лента и рецепт, поиск продуктов,
+короткие ссылки, выгрузка списка покупок) выполняются в ограниченном
+пуле потоков ASYNC_VIEW_THREADS: медленные клиенты ждут ответа в цикле
+событий, не занимая поток, а число соединений с базой не больше
+размера пула. Ответ рендерится в том же потоке пула.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django.urls import URLPattern, URLResolver
+
+from foodgram_backend.middleware import render_response
+from recipes.models import Recipe
+
+# Маршруты роутера, которые обслуживаются в пуле потоков (изменения
+# рецепта по адресу recipes-detail выполняются там же)
+ASYNC_ROUTES = (
+    'recipes-list',
+    'recipes-detail',
+    'recipes-get-link',
+    'recipes-download-shopping-cart',
+    'ingredients-list',
+    'ingredients-detail',
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Пул создается лазиво, уже в процессе воркера после fork
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_VIEW_THREADS,
+                thread_name_prefix='async-views'
+            )
+        return _executor
+
+
+def call_in_thread(func, *args, **kwargs):
+    # Сигналы request_started/request_finished отправляются в другом
+    # потоке, поэтому устаревшие соединения пула закрываем сами
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """Выполняет синхронную функцию в пуле, сохраняя контекст запроса."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), functools.partial(
+            context.run, call_in_thread, func, *args, **kwargs))
+
+
+def materialize(response):
+    """
+    Потоковый ответ Django 3.2 под ASGI читается в цикле событий, где
+    запросы к базе запрещены, поэтому документ собирается в пуле.
+    """
+    if not response.streaming:
+        return response
+    return HttpResponse(
+        b''.join(response.streaming_content),
+        status=response.status_code,
+        headers=response.headers
+    )
+
+
+def run_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    return materialize(render_response(request, response))
+
+
+def async_view(view):
+    """Асинхронная обертка синхронного представления DRF."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run_in_pool(run_view, view, request, *args, **kwargs)
+    return wrapper
+
+
+async def recipe_redirect_view(request, recipe_id):
+    # Проверяем, существует ли рецепт с указанным recipe_id
+    if not await run_in_pool(Recipe.objects.filter(id=recipe_id).exists):
+        raise Http404('Рецепт не найден')
+    # Перенаправляем на детальную страницу рецепта
+    return redirect(f'/recipes/{recipe_id}/')
+
+
+def with_async_views(urlpatterns):
+    """Заменяет представления маршрутов ASYNC_ROUTES асинхронными."""
+    patterns = []
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(
+                pattern.pattern, with_async_views(pattern.url_patterns),
+                pattern.default_kwargs, pattern.app_name, pattern.namespace)
+        elif pattern.name == 'recipe_redirect':
+            pattern = URLPattern(
+                pattern.pattern, recipe_redirect_view,
+                pattern.default_args, pattern.name)
+        elif pattern.name in ASYNC_ROUTES:
+            pattern = URLPattern(
+                pattern.pattern, async_view(pattern.callback),
+                pattern.default_args, pattern.name)
+        patterns.append(pattern)
+    return patterns
@@ -0,0 +1,196 @@
+"""
+Вспомогательные функции для команд замера производительности API.
+"""
+import math
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+User = get_user_model()
+
+BENCH_PREFIX = 'bench'
+BATCH_SIZE = 1000
+
+
+class Rollback(Exception):
+    """Прерывает транзакцию, чтобы откатить тестовые данные."""
+
+
+@contextmanager
+def rollback_atomic(keep=False):
+    """
+    Выполняет блок в транзакции и откатывает её в конце,
+    если не передан keep=True.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            if not keep:
+                raise Rollback
+    except Rollback:
+        pass
+
+
+def bench_host():
+    """
+    Имя хоста, которое проходит проверку ALLOWED_HOSTS. Шаблон '*'
+    не годится в заголовок Host, а '.example.com' разрешает и сам
+    домен example.com.
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host and host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def make_client(user=None):
+    """Клиент API, который проходит проверку ALLOWED_HOSTS."""
+    client = APIClient(HTTP_HOST=bench_host())
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(len(ordered) * percent / 100) - 1)
+    return ordered[index]
+
+
+def timed_request(client, url, method='get'):
+    """
+    Выполняет запрос и возвращает ответ, задержку в миллисекундах
+    и число SQL-запросов.
+    """
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        response = getattr(client, method)(url)
+        # Потоковые ответы читаем целиком, иначе замер неполный
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - start) * 1000
+    return response, elapsed, len(context.captured_queries)
+
+
+def measure(client, url, repeat, method='get'):
+    """
+    Выполняет запрос repeat раз и возвращает
+    число SQL-запросов и задержки в миллисекундах.
+    Ответ с ошибкой прерывает замер: его задержки ничего не говорят
+    о производительности запроса.
+    """
+    timings = []
+    for _ in range(repeat):
+        response, elapsed, queries = timed_request(client, url, method)
+        if not 200 <= response.status_code < 300:
+            raise CommandError(
+                f'{method.upper()} {url}: ответ {response.status_code}.')
+        timings.append(elapsed)
+    return {
+        'status': response.status_code,
+        'queries': queries,
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'max': max(timings),
+    }
+
+
+def zipf_weights(count, exponent):
+    """
+    Накопленные веса распределения Ципфа для рангов 1..count,
+    подходят для random.choices(cum_weights=...).
+    """
+    weights = []
+    total = 0
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        weights.append(total)
+    return weights
+
+
+def format_row(name, result):
+    return (f'{name:<50} {result["status"]:>6} {result["queries"]:>8} '
+            f'{result["p50"]:>9.1f} {result["p95"]:>9.1f} '
+            f'{result["max"]:>9.1f}')
+
+
+HEADER = (f'{"Запрос":<50} {"Статус":>6} {"Запросы":>8} '
+          f'{"p50, мс":>9} {"p95, мс":>9} {"max, мс":>9}')
+
+
+def seed_users(count):
+    User.objects.bulk_create(
+        [
+            User(
+                email=f'{BENCH_PREFIX}{i}@example.com',
+                username=f'{BENCH_PREFIX}{i}',
+                first_name='Bench',
+                last_name=str(i),
+            )
+            for i in range(count)
+        ],
+        batch_size=BATCH_SIZE
+    )
+    return list(User.objects.filter(username__startswith=BENCH_PREFIX))
+
+
+def seed_ingredients(count):
+    """Гарантирует наличие в базе не менее count продуктов."""
+    missing = count - Ingredient.objects.count()
+    if missing > 0:
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=f'{BENCH_PREFIX} {i}', measurement_unit='г')
+                for i in range(missing)
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+    return list(Ingredient.objects.values_list('id', flat=True)[:count])
+
+
+def seed_recipes(authors, count, ingredients_per_recipe):
+    """
+    Создает count рецептов, распределенных по авторам,
+    с ingredients_per_recipe продуктами в каждом.
+    """
+    ingredient_ids = seed_ingredients(ingredients_per_recipe * 4)
+    Recipe.objects.bulk_create(
+        [
+            Recipe(
+                author=authors[i % len(authors)],
+                name=f'{BENCH_PREFIX} {i}',
+                image='recipes_images/bench.png',
+                text='Рецепт для замера производительности',
+                cooking_time=i % 120 + 1,
+            )
+            for i in range(count)
+        ],
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = Recipe.objects.filter(
+        author__in=authors).values_list('id', flat=True)
+    RecipeIngredient.objects.bulk_create(
+        [
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_ids[
+                    (recipe_id + j) % len(ingredient_ids)],
+                amount=j + 1,
+            )
+            for recipe_id in recipe_ids
+            for j in range(ingredients_per_recipe)
+        ],
+        batch_size=BATCH_SIZE
+    )
+    return list(recipe_ids)
@@ -0,0 +1,208 @@
+"""
+Кэш готовых JSON-ответов списка и карточки рецепта для анонимных
+пользователей.
+
+Ключ ответа содержит версии: общую версию списка, версию рецепта и
+версию справочника продуктов. Сигналы моделей меняют нужные версии
+после фиксации транзакции, и старые записи больше не читаются.
+
+Для авторизованных пользователей кэшируются фрагменты — общая для всех
+пользователей часть сериализованного рецепта; флаги текущего
+пользователя накладываются на фрагменты при каждом запросе.
+"""
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+LIST_VERSION_KEY = 'recipes:list:version'
+CATALOG_VERSION_KEY = 'recipes:catalog:version'
+RECIPE_VERSION_KEY = 'recipes:detail:{pk}:version'
+FRAGMENT_KEY = 'recipes:fragment:{host}:{pk}:{catalog}:{version}'
+HITS_KEY = 'recipes:cache:hits'
+MISSES_KEY = 'recipes:cache:misses'
+
+# Поля рецепта, зависящие от текущего пользователя
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart', 'is_subscribed')
+
+# Поля пользователя, которые попадают в ответ с рецептом
+AUTHOR_FIELDS = {
+    'email', 'username', 'first_name', 'last_name', 'avatar',
+    'avatar_renditions',
+}
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Случайная версия не совпадет с вытесненной из кэша старой
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*keys):
+    """Меняет версии после фиксации текущей транзакции."""
+    transaction.on_commit(
+        lambda: cache.set_many({key: uuid4().hex for key in keys}, None))
+
+
+def response_key(request, pk=None):
+    """Ключ ответа по нормализованной строке запроса."""
+    query = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    )
+    versions = [get_version(CATALOG_VERSION_KEY)]
+    if pk is None:
+        versions.append(get_version(LIST_VERSION_KEY))
+    else:
+        versions.append(get_version(RECIPE_VERSION_KEY.format(pk=pk)))
+    # Ссылки на картинки абсолютные, поэтому учитываем схему и хост
+    raw = f'{request.scheme}://{request.get_host()}|{pk}|{query}|{versions}'
+    return 'recipes:response:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def is_cacheable(request):
+    return (
+        settings.RESPONSE_CACHE_TIMEOUT > 0
+        and not request.user.is_authenticated
+        and request.accepted_renderer.format == 'json'
+    )
+
+
+def get_response(key):
+    content = cache.get(key)
+    counter = MISSES_KEY if content is None else HITS_KEY
+    try:
+        cache.incr(counter)
+    except ValueError:
+        # Счетчика еще нет в кэше
+        cache.add(counter, 1, None)
+    return content
+
+
+def set_response(key, content):
+    cache.set(key, content, settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def fragment_keys(request, ids):
+    """Ключи фрагментов рецептов с учетом их текущих версий."""
+    version_keys = {pk: RECIPE_VERSION_KEY.format(pk=pk) for pk in ids}
+    versions = cache.get_many([CATALOG_VERSION_KEY, *version_keys.values()])
+    # Недостающие версии записываются одним запросом. Одновременный
+    # запрос может перезаписать их своими: любая случайная версия
+    # новая, поэтому устаревший фрагмент все равно не прочитается
+    missing = {
+        key: uuid4().hex
+        for key in {CATALOG_VERSION_KEY, *version_keys.values()}
+        if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    host = f'{request.scheme}://{request.get_host()}'
+    return {
+        pk: FRAGMENT_KEY.format(
+            host=host, pk=pk, catalog=versions[CATALOG_VERSION_KEY],
+            version=versions[key])
+        for pk, key in version_keys.items()
+    }
+
+
+def get_fragments(keys):
+    """Фрагменты из кэша одним запросом: {id рецепта: фрагмент}."""
+    fragments = cache.get_many(keys.values())
+    return {
+        pk: fragments[key] for pk, key in keys.items() if key in fragments
+    }
+
+
+def set_fragments(keys, recipes):
+    """
+    Сохраняет сериализованные рецепты без флагов пользователя
+    и возвращает их фрагменты.
+    """
+    fragments = {}
+    for recipe in recipes:
+        fragment = dict(recipe)
+        fragment['is_favorited'] = fragment['is_in_shopping_cart'] = None
+        fragment['author'] = dict(fragment['author'], is_subscribed=None)
+        fragments[fragment['id']] = fragment
+    cache.set_many(
+        {keys[pk]: fragment for pk, fragment in fragments.items()},
+        settings.RECIPE_FRAGMENT_CACHE_TIMEOUT
+    )
+    return fragments
+
+
+def overlay(fragment, flags):
+    """Накладывает флаги пользователя на общий фрагмент рецепта."""
+    return dict(
+        fragment,
+        is_favorited=flags['is_favorited'],
+        is_in_shopping_cart=flags['is_in_shopping_cart'],
+        author=dict(fragment['author'], is_subscribed=flags['is_subscribed'])
+    )
+
+
+def get_stats():
+    """
+    Попадания и промахи кэша ответов. Счетчики хранятся в самом кэше:
+    с LocMemCache они свои у каждого процесса.
+    """
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = stats.get(HITS_KEY, 0)
+    misses = stats.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def recipe_changed(sender, instance, **kwargs):
+    bump_version(LIST_VERSION_KEY, RECIPE_VERSION_KEY.format(pk=instance.pk))
+
+
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_version(
+        LIST_VERSION_KEY, RECIPE_VERSION_KEY.format(pk=instance.recipe_id))
+
+
+def ingredient_changed(sender, instance, **kwargs):
+    bump_version(LIST_VERSION_KEY, CATALOG_VERSION_KEY)
+
+
+def author_changed(sender, instance, created=False, update_fields=None,
+                   **kwargs):
+    # Например, обновление last_login при входе кэш не затрагивает
+    if created or (update_fields is not None
+                   and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        bump_version(LIST_VERSION_KEY, *(
+            RECIPE_VERSION_KEY.format(pk=pk) for pk in recipe_ids))
+
+
+def connect_signals(user_model):
+    for name, signal in (('save', post_save), ('delete', post_delete)):
+        signal.connect(recipe_changed, sender=Recipe,
+                       dispatch_uid=f'response_cache_recipe_{name}')
+        signal.connect(ingredient_changed, sender=Ingredient,
+                       dispatch_uid=f'response_cache_catalog_{name}')
+    # Только post_save: обработчик post_delete отключил бы быстрое
+    # удаление продуктов рецепта одним запросом, а при их удалении
+    # через API или админку сохраняется и сам рецепт
+    post_save.connect(recipe_ingredient_changed, sender=RecipeIngredient,
+                      dispatch_uid='response_cache_ingredients_save')
+    post_save.connect(author_changed, sender=user_model,
+                      dispatch_uid='response_cache_author')
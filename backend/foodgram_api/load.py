@@ -0,0 +1,172 @@
+"""
+Нагрузка на запущенный сервер по HTTP для команд bench_concurrency и
+bench_scaling: план запросов чтения и клиенты с постоянными
+соединениями. Клиенты можно разнести по нескольким процессам, чтобы
+генератор нагрузки не упирался в GIL раньше сервера.
+"""
+import http.client
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe
+
+from .benchmark import percentile, zipf_weights
+
+User = get_user_model()
+
+# Запросы чтения: вес и шаблон адреса; запросы со звездочкой — от имени
+# пользователя
+READ_MIX = (
+    (30, '/api/recipes/?limit=6'),
+    (15, '*/api/recipes/?limit=6'),
+    (25, '/api/recipes/{recipe}/'),
+    (15, '/api/ingredients/?name={name}'),
+    (5, '/api/recipes/{recipe}/get-link/'),
+    (5, '/api/s/{recipe}/'),
+    (5, '*/api/recipes/download_shopping_cart/'),
+)
+
+
+class Client(threading.Thread):
+    """Клиент с постоянным соединением, отправляющий запросы до срока."""
+
+    def __init__(self, target, plan, headers, deadline):
+        super().__init__(daemon=True)
+        self.target = target
+        self.plan = plan
+        self.headers = headers
+        self.deadline = deadline
+        self.timings = []
+        self.errors = 0
+
+    def connect(self):
+        return http.client.HTTPConnection(
+            self.target.hostname, self.target.port or 80, timeout=30)
+
+    def run(self):
+        connection = self.connect()
+        index = 0
+        while time.perf_counter() < self.deadline:
+            authorized, path = self.plan[index % len(self.plan)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                connection.request(
+                    'GET', path,
+                    headers=self.headers if authorized else {})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self.connect()
+                continue
+            if response.status >= 400:
+                self.errors += 1
+            else:
+                self.timings.append((time.perf_counter() - start) * 1000)
+        connection.close()
+
+
+def make_read_plan(seed, prefix, size=5000):
+    """
+    Последовательность запросов (нужна ли авторизация, путь) и заголовки
+    авторизованных запросов. Популярные рецепты запрашиваются чаще.
+    """
+    rng = random.Random(seed)
+    recipe_ids = list(Recipe.objects.order_by(
+        '-favorites_count', 'id').values_list('id', flat=True)[:1000])
+    names = [
+        name[:rng.randint(1, 3)].lower() for name in Ingredient.objects
+        .order_by('name').values_list('name', flat=True)[:500]
+    ]
+    if not recipe_ids or not names:
+        raise CommandError(
+            'В базе нет рецептов или продуктов: заполните ее '
+            'командой seed_load_data.')
+    user = User.objects.filter(
+        username__startswith=f'{prefix}-').order_by('id').first()
+    mix = READ_MIX
+    headers = {}
+    if user is None:
+        mix = [item for item in READ_MIX if not item[1].startswith('*')]
+    else:
+        token, _ = Token.objects.get_or_create(user=user)
+        headers['Authorization'] = f'Token {token.key}'
+
+    recipe_weights = zipf_weights(len(recipe_ids), 1.1)
+    plan = []
+    for _, template in rng.choices(
+            mix, weights=[weight for weight, _ in mix], k=size):
+        path = template.lstrip('*').format(
+            recipe=rng.choices(recipe_ids, cum_weights=recipe_weights)[0],
+            name=quote(rng.choice(names)))
+        plan.append((template.startswith('*'), path))
+    return plan, headers
+
+
+def run_clients(target, plan, headers, clients, duration, offset=0):
+    """
+    Запускает clients клиентов на duration секунд и возвращает задержки
+    успешных запросов, число ошибок и фактическую длительность.
+    """
+    start = time.perf_counter()
+    threads = [
+        # Клиенты начинают с разных мест плана
+        Client(target, plan[index * 97:] + plan[:index * 97],
+               headers, start + duration)
+        for index in range(offset, offset + clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (
+        [value for thread in threads for value in thread.timings],
+        sum(thread.errors for thread in threads),
+        time.perf_counter() - start,
+    )
+
+
+def run_load(target, plan, headers, clients, duration, processes=1):
+    """
+    Нагрузка clients клиентами, разнесенными по processes процессам.
+    Возвращает запросы в секунду, перцентили задержки и число ошибок.
+    """
+    processes = max(1, min(processes, clients))
+    if processes == 1:
+        results = [run_clients(target, plan, headers, clients, duration)]
+    else:
+        shares = [
+            clients // processes + (index < clients % processes)
+            for index in range(processes)
+        ]
+        offsets = [sum(shares[:index]) for index in range(processes)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(
+                run_clients,
+                [target] * processes, [plan] * processes,
+                [headers] * processes, shares, [duration] * processes,
+                offsets))
+
+    timings = [value for result in results for value in result[0]]
+    errors = sum(result[1] for result in results)
+    elapsed = max(result[2] for result in results)
+    if not timings:
+        return {'rps': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0,
+                'errors': errors}
+    return {
+        'rps': len(timings) / elapsed,
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99),
+        'errors': errors,
+    }
@@ -0,0 +1,184 @@
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient, Recipe
+
+from foodgram_api.benchmark import (
+    make_client, percentile, timed_request, zipf_weights)
+
+User = get_user_model()
+
+# Смесь запросов: имя, вес, нужна ли авторизация, шаблон адреса
+REQUEST_MIX = (
+    ('recipes', 25, False, '/api/recipes/?limit=6&offset={offset}'),
+    ('recipes_auth', 20, True, '/api/recipes/?limit=6&offset={offset}'),
+    ('recipes_author', 8, True, '/api/recipes/?limit=6&author={author}'),
+    ('recipes_favorited', 6, True, '/api/recipes/?limit=6&is_favorited=1'),
+    ('recipes_in_cart', 4, True,
+     '/api/recipes/?limit=6&is_in_shopping_cart=1'),
+    ('recipe_detail', 15, True, '/api/recipes/{recipe}/'),
+    ('ingredients_search', 10, False, '/api/ingredients/?name={name}'),
+    ('subscriptions', 5, True, '/api/users/subscriptions/?recipes_limit=3'),
+    ('shopping_cart', 2, True, '/api/recipes/download_shopping_cart/'),
+    ('users_me', 5, True, '/api/users/me/'),
+)
+
+# Число первых страниц ленты, между которыми распределяются запросы
+PAGES = 50
+
+
+class Command(BaseCommand):
+    help = ('Замер API на смеси типичных запросов к заполненной базе '
+            '(см. seed_load_data) со сравнением с сохраненным эталоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--warmup', type=int, default=200,
+            help='Число запросов для прогрева, не входящих в замер')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс пользователей, созданных seed_load_data')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument(
+            '--baseline', help='Сравнить с результатами из JSON-файла')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый относительный рост p95 по сравнению с эталоном')
+        parser.add_argument(
+            '--min-delta', type=float, default=2.0,
+            help='Рост p95 меньше этого значения (мс) не считается '
+                 'регрессией')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        plan = self.make_plan(rng, options)
+        for name, client, url in plan[:options['warmup']]:
+            timed_request(client, url)
+
+        results = {name: {'timings': [], 'queries': [], 'errors': []}
+                   for name, *_ in REQUEST_MIX}
+        for name, client, url in plan[options['warmup']:]:
+            response, elapsed, queries = timed_request(client, url)
+            result = results[name]
+            result['timings'].append(elapsed)
+            result['queries'].append(queries)
+            if response.status_code != 200:
+                result['errors'].append(f'{url}: {response.status_code}')
+
+        report = self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+        failures = [
+            error for result in results.values()
+            for error in result['errors'][:5]
+        ]
+        if options['baseline']:
+            failures += self.compare(report, options)
+        if failures:
+            raise CommandError(
+                'Замер не пройден:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Замер пройден.'))
+
+    def make_plan(self, rng, options):
+        """Последовательность запросов (имя, клиент, адрес)."""
+        users = list(User.objects.filter(
+            username__startswith=f'{options["prefix"]}-'
+        ).order_by('id')[:options['users']])
+        if not users:
+            raise CommandError(
+                'Нет пользователей для замера: заполните базу командой '
+                'seed_load_data.')
+        clients = {user.id: make_client(user) for user in users}
+        anonymous = make_client()
+
+        # Популярные рецепты и авторы запрашиваются чаще
+        recipe_ids = list(Recipe.objects.order_by(
+            '-favorites_count', 'id').values_list('id', flat=True)[:1000])
+        author_ids = list(User.objects.filter(recipes_count__gt=0).order_by(
+            '-followers_count', 'id').values_list('id', flat=True)[:1000])
+        pages = min(PAGES, max(1, Recipe.objects.count() // 6))
+        names = [
+            name[:rng.randint(1, 3)].lower() for name in Ingredient.objects
+            .order_by('name').values_list('name', flat=True)[:500]
+        ]
+        if not recipe_ids or not author_ids or not names:
+            raise CommandError('В базе нет рецептов или продуктов.')
+        recipe_weights = zipf_weights(len(recipe_ids), 1.1)
+        author_weights = zipf_weights(len(author_ids), 1.1)
+        page_weights = zipf_weights(pages, 1.1)
+
+        plan = []
+        for name, _, authorized, template in rng.choices(
+            REQUEST_MIX,
+            weights=[weight for _, weight, *_ in REQUEST_MIX],
+            k=options['warmup'] + options['requests']
+        ):
+            url = template.format(
+                offset=6 * rng.choices(
+                    range(pages), cum_weights=page_weights)[0],
+                author=rng.choices(author_ids, cum_weights=author_weights)[0],
+                recipe=rng.choices(recipe_ids, cum_weights=recipe_weights)[0],
+                name=rng.choice(names),
+            )
+            client = (clients[rng.choice(users).id] if authorized
+                      else anonymous)
+            plan.append((name, client, url))
+        return plan
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"Запрос":<20} {"Число":>6} {"Запр./с":>8} {"p50, мс":>8} '
+            f'{"p95, мс":>8} {"p99, мс":>8} {"SQL":>5}')
+        report = {}
+        for name, result in results.items():
+            timings = result['timings']
+            if not timings:
+                continue
+            report[name] = {
+                'count': len(timings),
+                'rps': round(len(timings) * 1000 / sum(timings), 1),
+                'p50': round(percentile(timings, 50), 2),
+                'p95': round(percentile(timings, 95), 2),
+                'p99': round(percentile(timings, 99), 2),
+                'queries': max(result['queries']),
+            }
+            row = report[name]
+            self.stdout.write(
+                f'{name:<20} {row["count"]:>6} {row["rps"]:>8.1f} '
+                f'{row["p50"]:>8.1f} {row["p95"]:>8.1f} '
+                f'{row["p99"]:>8.1f} {row["queries"]:>5}')
+        return report
+
+    def compare(self, report, options):
+        """Регрессии по сравнению с эталоном."""
+        try:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать эталон: {e}')
+
+        failures = []
+        for name, row in report.items():
+            if name not in baseline:
+                continue
+            base = baseline[name]
+            if row['queries'] > base['queries']:
+                failures.append(
+                    f'{name}: SQL-запросов {row["queries"]}, '
+                    f'в эталоне {base["queries"]}')
+            limit = max(base['p95'] * (1 + options['tolerance']),
+                        base['p95'] + options['min_delta'])
+            if row['p95'] > limit:
+                failures.append(
+                    f'{name}: p95 {row["p95"]} мс, '
+                    f'в эталоне {base["p95"]} мс')
+        return failures
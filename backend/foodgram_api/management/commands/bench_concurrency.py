@@ -0,0 +1,142 @@
+import json
+import socket
+import threading
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram_api.load import make_read_plan, run_load
+
+
+class SlowClient(threading.Thread):
+    """
+    Медленный клиент: отправляет заголовки запроса по байту с паузами,
+    занимая соединение, как клиент на плохой мобильной сети.
+    """
+
+    def __init__(self, target, delay, stop):
+        super().__init__(daemon=True)
+        self.target = target
+        self.delay = delay
+        self.stop = stop
+
+    def run(self):
+        request = (f'GET /api/recipes/?limit=6 HTTP/1.1\r\n'
+                   f'Host: {self.target.hostname}\r\n\r\n').encode()
+        while not self.stop.is_set():
+            try:
+                with socket.create_connection(
+                        (self.target.hostname, self.target.port or 80),
+                        timeout=30) as connection:
+                    for byte in request:
+                        if self.stop.wait(self.delay):
+                            return
+                        connection.sendall(bytes([byte]))
+                    connection.recv(65536)
+            except OSError:
+                if self.stop.wait(self.delay):
+                    return
+
+
+class Command(BaseCommand):
+    help = ('Замер задержки запросов чтения на запущенном сервере при '
+            'разном числе одновременных клиентов. Позволяет сравнить '
+            'режимы WSGI и ASGI на одной базе: '
+            '--target wsgi=http://127.0.0.1:8001 '
+            '--target asgi=http://127.0.0.1:8002')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', default=[],
+            help='Имя и адрес сервера: имя=http://хост:порт '
+                 '(можно указать несколько)')
+        parser.add_argument(
+            '--levels', default='1,4,16,64',
+            help='Числа одновременных клиентов через запятую')
+        parser.add_argument(
+            '--duration', type=float, default=10.0,
+            help='Длительность замера на каждом уровне, с')
+        parser.add_argument(
+            '--warmup', type=float, default=2.0,
+            help='Прогрев перед замерами каждого сервера, с')
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Число медленных клиентов, занимающих соединения '
+                 'во время замера')
+        parser.add_argument(
+            '--slow-delay', type=float, default=0.5,
+            help='Пауза медленного клиента между байтами запроса, с')
+        parser.add_argument(
+            '--client-processes', type=int, default=1,
+            help='Число процессов, по которым распределяются клиенты')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс пользователей, созданных seed_load_data')
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        targets = self.parse_targets(options['target'])
+        try:
+            levels = [int(level) for level in options['levels'].split(',')]
+        except ValueError:
+            raise CommandError('--levels: ожидаются целые числа')
+        plan, headers = make_read_plan(options['seed'], options['prefix'])
+
+        report = {}
+        for name, target in targets:
+            self.stdout.write(f'{name}: {target.geturl()}')
+            run_load(target, plan, headers, 4, options['warmup'])
+            report[name] = {}
+            for level in levels:
+                result = self.measure(target, plan, headers, level, options)
+                report[name][level] = result
+                self.stdout.write(
+                    f'  клиентов {level:>4}: {result["rps"]:>8.1f} запр/с, '
+                    f'p50 {result["p50"]:>8.1f} мс, '
+                    f'p95 {result["p95"]:>8.1f} мс, '
+                    f'p99 {result["p99"]:>8.1f} мс, '
+                    f'ошибок {result["errors"]}')
+
+        self.print_curves(report, levels)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def parse_targets(values):
+        targets = []
+        for value in values or ['server=http://127.0.0.1:8000']:
+            name, _, url = value.rpartition('=')
+            target = urlsplit(url)
+            if target.scheme != 'http' or not target.hostname:
+                raise CommandError(f'Неверный адрес сервера: {value}')
+            targets.append((name or target.netloc, target))
+        return targets
+
+    def measure(self, target, plan, headers, level, options):
+        stop = threading.Event()
+        slow_clients = [
+            SlowClient(target, options['slow_delay'], stop)
+            for _ in range(options['slow_clients'])
+        ]
+        for client in slow_clients:
+            client.start()
+        try:
+            return run_load(target, plan, headers, level,
+                            options['duration'], options['client_processes'])
+        finally:
+            stop.set()
+
+    def print_curves(self, report, levels):
+        """p95 по числу клиентов: строки — уровни, столбцы — серверы."""
+        names = list(report)
+        self.stdout.write('\np95, мс (запросов в секунду)')
+        self.stdout.write(f'{"Клиентов":>8} ' + ' '.join(
+            f'{name:>22}' for name in names))
+        for level in levels:
+            self.stdout.write(f'{level:>8} ' + ' '.join(
+                f'{report[name][level]["p95"]:>10.1f} '
+                f'({report[name][level]["rps"]:>8.1f})'
+                for name in names))
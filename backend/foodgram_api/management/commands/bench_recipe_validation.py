@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from foodgram_api.benchmark import (
+    percentile, rollback_atomic, seed_ingredients)
+from foodgram_api.serializers import RecipeSerializer
+
+
+class Command(BaseCommand):
+    help = ('Замер валидации рецепта (RecipeSerializer.is_valid) '
+            'в зависимости от числа продуктов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rollback_atomic():
+            ingredient_ids = seed_ingredients(max(options['sizes']))
+            self.stdout.write(
+                f'{"Продуктов":>10} {"Запросы":>8} '
+                f'{"p50, мс":>9} {"p95, мс":>9}')
+            for size in options['sizes']:
+                data = {
+                    'name': 'Рецепт',
+                    'text': 'Описание',
+                    'cooking_time': 10,
+                    'image': None,
+                    'ingredients': [
+                        {'id': ingredient_id, 'amount': 1}
+                        for ingredient_id in ingredient_ids[:size]
+                    ],
+                }
+                timings = []
+                for _ in range(options['repeat']):
+                    serializer = RecipeSerializer(data=data)
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        serializer.is_valid(raise_exception=True)
+                        timings.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(
+                    f'{size:>10} {len(context.captured_queries):>8} '
+                    f'{percentile(timings, 50):>9.2f} '
+                    f'{percentile(timings, 95):>9.2f}')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from foodgram_api.benchmark import (
+    HEADER, format_row, make_client, measure, rollback_atomic,
+    seed_recipes, seed_users)
+
+
+class Command(BaseCommand):
+    help = ('Замер числа SQL-запросов и задержки списка '
+            'и карточки рецепта на сгенерированных данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=3000)
+        parser.add_argument('--ingredients', type=int, default=15)
+        parser.add_argument('--authors', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не удалять сгенерированные данные после замера')
+
+    def handle(self, *args, **options):
+        with rollback_atomic(keep=options['keep']):
+            authors = seed_users(options['authors'])
+            recipe_ids = seed_recipes(
+                authors, options['recipes'], options['ingredients'])
+            self.stdout.write(
+                f'Создано рецептов: {len(recipe_ids)}, '
+                f'продуктов в рецепте: {options["ingredients"]}')
+
+            urls = (
+                '/api/recipes/?limit=6',
+                '/api/recipes/?limit=100',
+                f'/api/recipes/?limit=6&offset={len(recipe_ids) - 6}',
+                f'/api/recipes/?limit=6&author={authors[0].id}',
+                f'/api/recipes/{recipe_ids[0]}/',
+            )
+            self.stdout.write(HEADER)
+            for client_name, client in (
+                ('аноним', make_client()),
+                ('автор', make_client(authors[0])),
+            ):
+                for url in urls:
+                    self.stdout.write(format_row(
+                        f'{client_name} {url}',
+                        measure(client, url, options['repeat'])
+                    ))
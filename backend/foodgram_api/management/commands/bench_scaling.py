@@ -0,0 +1,187 @@
+import http.client
+import json
+import os
+import runpy
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram_api.load import make_read_plan, run_load
+
+
+def config_cpu_count():
+    """Число ядер так, как его считает gunicorn.conf.py."""
+    return runpy.run_path(
+        str(settings.BASE_DIR / 'gunicorn.conf.py'))['cpu_count']()
+
+
+class Command(BaseCommand):
+    help = ('Замер пропускной способности gunicorn с настройками '
+            'gunicorn.conf.py при разном числе воркеров: сервер '
+            'запускается заново для каждого числа воркеров, клиентов '
+            'столько, чтобы загрузить все воркеры. Генератор нагрузки '
+            'занимает те же ядра, поэтому для честного замера на '
+            'многоядерной машине ограничьте сервер и клиентов разными '
+            'ядрами (taskset) или увеличьте --client-processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            help='Числа воркеров через запятую (по умолчанию 1, 2, 4, ... '
+                 'до числа ядер)')
+        parser.add_argument(
+            '--mode', choices=('wsgi', 'asgi'), default='wsgi',
+            help='Режим сервера SERVER_MODE')
+        parser.add_argument(
+            '--port', type=int, default=8100,
+            help='Порт, на котором запускается сервер')
+        parser.add_argument(
+            '--clients-per-worker', type=int, default=4,
+            help='Одновременных клиентов на воркер')
+        parser.add_argument(
+            '--client-processes', type=int,
+            help='Число процессов генератора нагрузки (по умолчанию '
+                 'по числу ядер, но не больше 4)')
+        parser.add_argument(
+            '--duration', type=float, default=10.0,
+            help='Длительность замера для каждого числа воркеров, с')
+        parser.add_argument(
+            '--warmup', type=float, default=3.0,
+            help='Прогрев после запуска сервера, с')
+        parser.add_argument(
+            '--startup-timeout', type=float, default=30.0,
+            help='Сколько ждать запуска сервера, с')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс пользователей, созданных seed_load_data')
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        cores = config_cpu_count()
+        if options['workers']:
+            try:
+                levels = [int(value)
+                          for value in options['workers'].split(',')]
+            except ValueError:
+                raise CommandError('--workers: ожидаются целые числа')
+        else:
+            levels = [1]
+            while levels[-1] * 2 <= cores:
+                levels.append(levels[-1] * 2)
+        processes = options['client_processes'] or min(cores, 4)
+        target = urlsplit(f'http://127.0.0.1:{options["port"]}')
+        plan, headers = make_read_plan(options['seed'], options['prefix'])
+
+        self.stdout.write(
+            f'Режим {options["mode"]}, ядер: {cores}, процессов '
+            f'генератора нагрузки: {processes}')
+        if max(levels) > cores:
+            self.stdout.write(self.style.WARNING(
+                'Воркеров больше, чем ядер: рост пропускной способности '
+                'дальше ограничен процессором.'))
+
+        report = {}
+        for workers in levels:
+            clients = workers * options['clients_per_worker']
+            with Server(workers, options):
+                run_load(target, plan, headers, clients,
+                         options['warmup'], processes)
+                result = run_load(target, plan, headers, clients,
+                                  options['duration'], processes)
+            result['clients'] = clients
+            report[workers] = result
+            self.stdout.write(
+                f'  воркеров {workers:>3} (клиентов {clients:>4}): '
+                f'{result["rps"]:>8.1f} запр/с, '
+                f'p50 {result["p50"]:>8.1f} мс, '
+                f'p95 {result["p95"]:>8.1f} мс, '
+                f'ошибок {result["errors"]}')
+
+        self.print_scaling(report, levels)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'mode': options['mode'], 'cores': cores,
+                           'results': report},
+                          file, ensure_ascii=False, indent=2)
+
+    def print_scaling(self, report, levels):
+        """Ускорение относительно первого числа воркеров и эффективность."""
+        base_workers = levels[0]
+        base = report[base_workers]['rps']
+        self.stdout.write(
+            f'\n{"Воркеров":>8} {"Запр/с":>10} {"Ускорение":>10} '
+            f'{"Эффективность":>14}')
+        for workers in levels:
+            rps = report[workers]['rps']
+            speedup = rps / base if base else 0.0
+            efficiency = speedup * base_workers / workers
+            self.stdout.write(
+                f'{workers:>8} {rps:>10.1f} {speedup:>10.2f} '
+                f'{efficiency:>13.0%}')
+
+
+class Server:
+    """Процесс gunicorn с gunicorn.conf.py на время одного замера."""
+
+    def __init__(self, workers, options):
+        self.workers = workers
+        self.options = options
+        self.process = None
+
+    def __enter__(self):
+        port = self.options['port']
+        env = {
+            **os.environ,
+            'SERVER_MODE': self.options['mode'],
+            'GUNICORN_WORKERS': str(self.workers),
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+            # Перезапуски воркеров посреди замера исказили бы результат
+            'GUNICORN_MAX_REQUESTS': '0',
+            'GUNICORN_LOG_LEVEL': 'warning',
+        }
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn',
+             '--config', 'gunicorn.conf.py'],
+            cwd=settings.BASE_DIR, env=env)
+        try:
+            self.wait_ready(port)
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def wait_ready(self, port):
+        deadline = time.monotonic() + self.options['startup_timeout']
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(
+                    f'gunicorn завершился с кодом {self.process.returncode}')
+            connection = http.client.HTTPConnection(
+                '127.0.0.1', port, timeout=5)
+            try:
+                connection.request('GET', '/api/ingredients/?name=a')
+                if connection.getresponse().status == 200:
+                    return
+            except (OSError, http.client.HTTPException):
+                pass
+            finally:
+                connection.close()
+            time.sleep(0.2)
+        raise CommandError('gunicorn не ответил за --startup-timeout секунд')
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=self.options['startup_timeout'])
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
@@ -0,0 +1,52 @@
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingCartTotal
+
+from foodgram_api.benchmark import (
+    HEADER, format_row, make_client, measure, rollback_atomic,
+    seed_recipes, seed_users)
+
+
+class Command(BaseCommand):
+    help = ('Замер выгрузки списка покупок во всех форматах '
+            'для большой корзины на сгенерированных данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=15)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rollback_atomic():
+            authors = seed_users(10)
+            recipe_ids = seed_recipes(
+                authors, options['recipes'], options['ingredients'])
+            user = authors[0]
+            ShoppingCart.objects.bulk_create([
+                ShoppingCart(user=user, recipe_id=recipe_id)
+                for recipe_id in recipe_ids
+            ])
+            ShoppingCartTotal.apply([user.id], dict(
+                RecipeIngredient.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).values('ingredient_id').annotate(
+                    total=Sum('amount')
+                ).order_by().values_list('ingredient_id', 'total')
+            ))
+            self.stdout.write(f'Рецептов в корзине: {len(recipe_ids)}')
+
+            client = make_client(user)
+            self.stdout.write(f'{HEADER} {"Пик памяти, КБ":>15}')
+            for file_format in ('txt', 'csv', 'pdf'):
+                url = ('/api/recipes/download_shopping_cart/'
+                       f'?format={file_format}')
+                tracemalloc.start()
+                result = measure(client, url, options['repeat'])
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.stdout.write(
+                    f'{format_row(url, result)} {peak // 1024:>15}')
@@ -0,0 +1,130 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (
+    FavoriteRecipe, RecipeIngredient, ShoppingCart, ShoppingCartTotal,
+    Subscribe)
+
+from foodgram_api.benchmark import (
+    make_client, rollback_atomic, seed_recipes, seed_users)
+
+# Последовательное чтение таблицы в плане запроса
+SEQ_SCAN_PATTERNS = {
+    'postgresql': r'Seq Scan on "?{table}"?\b',
+    'sqlite': r'\bSCAN (TABLE )?{table}\b(?! USING)',
+}
+
+
+def explain(sql):
+    if connection.vendor == 'postgresql':
+        query = f'EXPLAIN {sql}'
+    else:
+        query = f'EXPLAIN QUERY PLAN {sql}'
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        return '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+
+
+class Command(BaseCommand):
+    help = ('Проверка по EXPLAIN, что запросы основных эндпоинтов '
+            'читают горячие таблицы по индексам, а не целиком')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы всех проверенных запросов')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQ_SCAN_PATTERNS:
+            raise CommandError(
+                f'EXPLAIN для {connection.vendor} не поддерживается.')
+
+        failures = []
+        with rollback_atomic():
+            authors = seed_users(100)
+            recipe_ids = seed_recipes(authors, options['recipes'], 10)
+            self.seed_relations(authors, recipe_ids)
+
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                    # Если индекса для запроса нет, план все равно
+                    # покажет Seq Scan, независимо от размера данных
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            user = authors[0]
+            client = make_client(user)
+            endpoints = (
+                ('/api/recipes/?limit=6',
+                 ['recipes_recipe']),
+                (f'/api/recipes/?limit=6&author={authors[1].id}',
+                 ['recipes_recipe']),
+                ('/api/recipes/?limit=6&is_favorited=1',
+                 ['recipes_recipe', 'recipes_favoriterecipe']),
+                ('/api/recipes/?limit=6&is_in_shopping_cart=1',
+                 ['recipes_recipe', 'recipes_shoppingcart']),
+                (f'/api/recipes/{recipe_ids[0]}/',
+                 ['recipes_recipe', 'recipes_recipeingredient']),
+                ('/api/users/subscriptions/?recipes_limit=3',
+                 ['recipes_subscribe', 'recipes_recipe']),
+                ('/api/recipes/download_shopping_cart/',
+                 ['recipes_shoppingcarttotal', 'recipes_shoppingcart']),
+            )
+            for url, tables in endpoints:
+                failures += self.check_endpoint(
+                    client, url, tables, options['verbose_plans'])
+
+        if failures:
+            raise CommandError(
+                'Последовательное чтение таблиц:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            'Все запросы используют индексы.'))
+
+    def seed_relations(self, authors, recipe_ids):
+        user = authors[0]
+        FavoriteRecipe.objects.bulk_create(
+            FavoriteRecipe(user=author, recipe_id=recipe_id)
+            for author in authors for recipe_id in recipe_ids[::50]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=author, recipe_id=recipe_id)
+            for author in authors for recipe_id in recipe_ids[1::50]
+        )
+        Subscribe.objects.bulk_create(
+            Subscribe(user=user, author=author) for author in authors[1:])
+        ShoppingCartTotal.apply([user.id], dict(
+            RecipeIngredient.objects.filter(
+                recipe__shoppingcarts__user=user
+            ).values('ingredient_id').annotate(
+                total=Sum('amount')
+            ).order_by().values_list('ingredient_id', 'total')
+        ))
+
+    def check_endpoint(self, client, url, tables, verbose):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code != 200:
+            return [f'{url}: статус ответа {response.status_code}']
+
+        failures = []
+        pattern = SEQ_SCAN_PATTERNS[connection.vendor]
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            plan = explain(sql)
+            if verbose:
+                self.stdout.write(f'{url}\n{sql}\n{plan}\n')
+            for table in tables:
+                if re.search(pattern.format(table=table), plan):
+                    failures.append(f'{url}: {table}\n  {sql}\n{plan}')
+        self.stdout.write(
+            f'{url}: проверено запросов {len(context.captured_queries)}')
+        return failures
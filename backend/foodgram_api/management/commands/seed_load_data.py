@@ -0,0 +1,271 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.models import (
+    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    Subscribe)
+
+from foodgram_api import cache as response_cache
+from foodgram_api.benchmark import seed_ingredients, zipf_weights
+
+User = get_user_model()
+
+WORDS = (
+    'нарезать', 'обжарить', 'добавить', 'перемешать', 'довести', 'до',
+    'кипения', 'посолить', 'поперчить', 'тушить', 'минут', 'на',
+    'среднем', 'огне', 'подавать', 'горячим', 'с', 'зеленью', 'и',
+    'сметаной', 'духовке', 'при', 'температуре', 'градусов',
+)
+
+
+def copy_value(value):
+    """Значение поля в текстовом формате COPY."""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_objects(model, objects):
+    """Вставка объектов одной командой COPY (только PostgreSQL)."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    buffer = io.StringIO()
+    for obj in objects:
+        buffer.write('\t'.join(
+            copy_value(field.get_db_prep_save(
+                getattr(obj, field.attname), connection))
+            for field in fields
+        ) + '\n')
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN',
+            buffer
+        )
+
+
+@contextmanager
+def explicit_pub_date():
+    """Позволяет bulk_create сохранить заданную дату публикации."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def pick_unique(rng, population, cum_weights, count, exclude=None):
+    """
+    count различных элементов population, выбранных с весами.
+    Выбирается не больше половины population, иначе редкие
+    элементы с малым весом пришлось бы ждать слишком долго.
+    """
+    count = min(count, len(population) // 2)
+    # Словарь сохраняет порядок выбора, в отличие от множества
+    chosen = {}
+    while len(chosen) < count:
+        for item in rng.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen)
+        ):
+            if item != exclude:
+                chosen[item] = None
+    return list(chosen)
+
+
+class Command(BaseCommand):
+    help = ('Генерация воспроизводимого набора данных для нагрузочного '
+            'тестирования: пользователи, рецепты, избранное, корзины '
+            'и подписки с распределением Ципфа')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=12)
+        parser.add_argument(
+            '--ingredient-skew', type=float, default=1.0,
+            help='Показатель распределения Ципфа для выбора продуктов '
+                 '(0 — равномерно)')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности '
+                 'рецептов и авторов')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число избранных рецептов у пользователя')
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Среднее число рецептов в корзине у пользователя')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок у пользователя')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс имен созданных пользователей')
+        parser.add_argument(
+            '--password', default='load-password',
+            help='Пароль всех созданных пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY в PostgreSQL')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['min_ingredients'] <= options['max_ingredients']:
+            raise CommandError('Неверный диапазон числа продуктов.')
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно не меньше 2 пользователей и 1 рецепта.')
+        self.prefix = f'{options["prefix"]}-'
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом "{self.prefix}" уже есть: '
+                f'укажите другой --prefix или очистите базу (flush).')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy'])
+        self.now = timezone.now()
+
+        with transaction.atomic(), explicit_pub_date():
+            user_ids = self.create_users(
+                options['users'], make_password(options['password']))
+            recipe_ids = self.create_recipes(user_ids, options)
+            self.create_relations(user_ids, recipe_ids, options)
+
+        # Массовая вставка не отправляет сигналы: пересчитываем
+        # счетчики, итоги списков покупок и сбрасываем кэш ленты
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_cart_totals', stdout=self.stdout)
+        response_cache.bump_version(response_cache.LIST_VERSION_KEY)
+        self.stdout.write(self.style.SUCCESS('Данные созданы.'))
+
+    def save(self, model, objects):
+        """Сохраняет объекты блоками через COPY или bulk_create."""
+        start = time.perf_counter()
+        total = 0
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            if self.use_copy:
+                copy_objects(model, batch)
+            else:
+                model.objects.bulk_create(batch)
+            total += len(batch)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {total}, '
+            f'{total / elapsed if elapsed else total:.0f} строк/с')
+
+    def create_users(self, count, password):
+        self.save(User, (
+            User(
+                email=f'{self.prefix}{i}@example.com',
+                username=f'{self.prefix}{i}',
+                first_name='Нагрузка',
+                last_name=str(i),
+                password=password,
+                date_joined=self.now - timedelta(days=count - i),
+            )
+            for i in range(count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=self.prefix
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, user_ids, options):
+        rng = self.rng
+        count = options['recipes']
+
+        # Популярность авторов: ранги Ципфа в случайном порядке
+        authors = rng.sample(user_ids, len(user_ids))
+        recipe_authors = rng.choices(
+            authors, cum_weights=zipf_weights(len(authors), options['skew']),
+            k=count)
+        self.save(Recipe, (
+            Recipe(
+                author_id=author_id,
+                name=f'{self.prefix}{i} ' + ' '.join(rng.sample(WORDS, 3)),
+                image='recipes_images/load.png',
+                text=' '.join(rng.choices(WORDS, k=rng.randint(20, 200))),
+                cooking_time=rng.randint(1, 180),
+                pub_date=self.now - timedelta(minutes=count - i),
+            )
+            for i, author_id in enumerate(recipe_authors)
+        ))
+        recipe_ids = list(Recipe.objects.filter(
+            author__username__startswith=self.prefix
+        ).order_by('id').values_list('id', flat=True))
+
+        ingredient_ids = list(
+            Ingredient.objects.order_by('name', 'measurement_unit')
+            .values_list('id', flat=True))
+        if len(ingredient_ids) < options['max_ingredients'] * 2:
+            self.stdout.write(self.style.WARNING(
+                'Справочник продуктов почти пуст, создаются тестовые '
+                'продукты (загрузите его командой import_ingredients).'))
+            ingredient_ids = seed_ingredients(options['max_ingredients'] * 4)
+        ingredients = rng.sample(ingredient_ids, len(ingredient_ids))
+        ingredient_weights = zipf_weights(
+            len(ingredients), options['ingredient_skew'])
+        self.save(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in pick_unique(
+                rng, ingredients, ingredient_weights,
+                rng.randint(
+                    options['min_ingredients'], options['max_ingredients'])
+            )
+        ))
+        return recipe_ids
+
+    def create_relations(self, user_ids, recipe_ids, options):
+        rng = self.rng
+        recipes = rng.sample(recipe_ids, len(recipe_ids))
+        recipe_weights = zipf_weights(len(recipes), options['skew'])
+        for model, average in (
+            (FavoriteRecipe, options['favorites']),
+            (ShoppingCart, options['carts']),
+        ):
+            self.save(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in pick_unique(
+                    rng, recipes, recipe_weights,
+                    rng.randint(0, 2 * average))
+            ))
+
+        authors = rng.sample(user_ids, len(user_ids))
+        author_weights = zipf_weights(len(authors), options['skew'])
+        self.save(Subscribe, (
+            Subscribe(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in pick_unique(
+                rng, authors, author_weights,
+                rng.randint(0, 2 * options['subscriptions']),
+                exclude=user_id)
+        ))
@@ -0,0 +1,152 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    LimitOffsetPagination, PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Для таблиц меньше этого размера точный COUNT дешевле оценки
+COUNT_ESTIMATE_THRESHOLD = 10000
+
+
+def estimate_count(queryset):
+    """
+    Число строк без полного COUNT: для таблицы без фильтров
+    в PostgreSQL берется оценка планировщика из pg_class.
+    Для отфильтрованных выборок число не считается.
+    """
+    if queryset.query.where or connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE relname = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < COUNT_ESTIMATE_THRESHOLD:
+        return queryset.count()
+    return int(row[0])
+
+
+class LimitPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с размером страницы из ?limit=: нечисловое
+    значение заменяется размером по умолчанию, слишком большое —
+    max_page_size.
+    """
+    page_size = 10
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class RecipePagination(LimitOffsetPagination):
+    """
+    Пагинация ленты рецептов: limit/offset по умолчанию (используется
+    фронтендом) и, при наличии параметра cursor, курсорная пагинация
+    по ключу (pub_date, id) без сканирования предыдущих строк.
+
+    Первая страница в курсорном режиме запрашивается с пустым ?cursor=,
+    следующие — по ссылкам next и previous из ответа.
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request) or self.default_limit or 10
+        self.count = estimate_count(queryset)
+        reverse, position = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+
+        if position is None:
+            queryset = queryset.order_by('-pub_date', '-id')
+        else:
+            pub_date, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date)
+                    | Q(pub_date=pub_date, id__gt=pk)
+                ).order_by('pub_date', 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date)
+                    | Q(pub_date=pub_date, id__lt=pk)
+                ).order_by('-pub_date', '-id')
+
+        # Лишняя строка показывает, есть ли страница дальше
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            first, last = results[0], results[-1]
+            if has_more or reverse:
+                self.next_position = self.get_position(last)
+            if position is not None and (has_more or not reverse):
+                self.previous_position = self.get_position(first)
+        return results
+
+    @staticmethod
+    def get_position(row):
+        # Строка может быть моделью или словарем из values()
+        if isinstance(row, dict):
+            return row['pub_date'], row['id']
+        return row.pub_date, row.id
+
+    @staticmethod
+    def encode_cursor(reverse, position):
+        pub_date, pk = position
+        raw = f'{int(reverse)}|{pub_date.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        if not cursor:
+            return False, None
+        try:
+            reverse, pub_date, pk = base64.urlsafe_b64decode(
+                cursor.encode()).decode().split('|')
+            return reverse == '1', (datetime.fromisoformat(pub_date), int(pk))
+        except (TypeError, ValueError):
+            raise NotFound('Неверный курсор.')
+
+    def get_cursor_link(self, reverse, position):
+        if position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(reverse, position)
+        )
+
+    def get_next_link(self):
+        if getattr(self, 'cursor_mode', False):
+            return self.get_cursor_link(False, self.next_position)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if getattr(self, 'cursor_mode', False):
+            return self.get_cursor_link(True, self.previous_position)
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
@@ -1,4 +1,13 @@
+import csv
+import zlib
 from datetime import datetime
+from itertools import chain, islice
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
 
 # Заготовки для текста
 SHOPPING_LIST_HEADER = "Список покупок (составлен: {date}):"
@@ -6,41 +15,227 @@ PRODUCT_ITEM = "{index}. {name} - {amount} {unit}"
 RECIPE_LIST_HEADER = "Для следующих рецептов:"
 RECIPE_ITEM = "- {recipe}"
 EMPTY_LIST_MESSAGE = "Список покупок пуст."
+CSV_HEADER = ('№', 'Продукт', 'Количество', 'Единица измерения')
+
+# Сколько строк отдавать клиенту одним блоком
+LINES_PER_CHUNK = 500
+
+# Страница PDF: A4 в пунктах и размер растра страницы
+PDF_PAGE_SIZE = (595.28, 841.89)
+PDF_RASTER_SIZE = (1240, 1754)
+PDF_MARGIN = 80
+PDF_FONT_SIZE = 28
+PDF_LINE_HEIGHT = 42
 
 
 def render_shopping_list(ingredients, recipes):
     """
-    Рендерит список покупок в текстовом формате
+    Построчно рендерит список покупок в текстовом формате
     с датой, нумерацией и перечнем рецептов.
+    Ингредиенты и рецепты читаются из итераторов по мере вывода.
     """
     # Текущая дата
     date_now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    if not ingredients:
-        return EMPTY_LIST_MESSAGE.format(date=date_now)
-
-    # Формируем отчет одной операцией
-    return '\n'.join([
-        # Заголовок списка покупок
-        SHOPPING_LIST_HEADER.format(date=date_now),
-
-        # Продукты с нумерацией
-        *[
-            PRODUCT_ITEM.format(
-                index=i,
-                name=ingredient["name"].capitalize(),
-                amount=ingredient["amount"],
-                unit=ingredient["measurement_unit"]
-            )
-            for i, ingredient in enumerate(ingredients)
-        ],
-
-        # Заголовок рецептов, если они есть
-        RECIPE_LIST_HEADER,
-
-        # Список рецептов
-        *[
-            RECIPE_ITEM.format(recipe=recipe)
-            for recipe in recipes
-        ]
-    ])
+    ingredients = iter(ingredients)
+    first = next(ingredients, None)
+    if first is None:
+        yield EMPTY_LIST_MESSAGE.format(date=date_now)
+        return
+
+    # Заголовок списка покупок
+    yield SHOPPING_LIST_HEADER.format(date=date_now)
+
+    # Продукты с нумерацией
+    for i, ingredient in enumerate(chain([first], ingredients), start=1):
+        yield PRODUCT_ITEM.format(
+            index=i,
+            name=ingredient["name"].capitalize(),
+            amount=ingredient["amount"],
+            unit=ingredient["measurement_unit"]
+        )
+
+    # Заголовок рецептов и список рецептов
+    yield RECIPE_LIST_HEADER
+    for recipe in recipes:
+        yield RECIPE_ITEM.format(recipe=recipe)
+
+
+def chunked(iterable, size=LINES_PER_CHUNK):
+    """Разбивает итератор на списки не длиннее size."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый потоковый рендерер списка покупок.
+    Выбирается DRF по параметру ?format= или заголовку Accept.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # DRF использует render только для ответов с ошибками
+        if isinstance(data, dict):
+            lines = [str(value) for value in data.values()]
+        else:
+            lines = [str(data)]
+        return b''.join(self.stream_lines(lines))
+
+    def stream(self, ingredients, recipes):
+        """Генератор байтовых блоков с готовым документом."""
+        return self.stream_lines(render_shopping_list(ingredients, recipes))
+
+    def stream_lines(self, lines):
+        """По умолчанию документ — строки текста, по одной на строку."""
+        for chunk in chunked(lines):
+            yield ''.join(f'{line}\n' for line in chunk).encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CsvShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    class Echo:
+        """Псевдобуфер: csv.writer возвращает записанную строку."""
+
+        def write(self, value):
+            return value
+
+    def stream(self, ingredients, recipes):
+        rows = (
+            (i, ingredient['name'], ingredient['amount'],
+             ingredient['measurement_unit'])
+            for i, ingredient in enumerate(ingredients, start=1)
+        )
+        return self.stream_rows(chain([CSV_HEADER], rows))
+
+    def stream_lines(self, lines):
+        return self.stream_rows([line] for line in lines)
+
+    def stream_rows(self, rows):
+        writer = csv.writer(self.Echo())
+        for chunk in chunked(rows):
+            yield ''.join(
+                writer.writerow(row) for row in chunk).encode(self.charset)
+
+
+class PdfShoppingListRenderer(ShoppingListRenderer):
+    """
+    PDF без внешних зависимостей: каждая страница растеризуется
+    через Pillow и записывается как изображение, документ отдается
+    по мере готовности страниц.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def get_font(self):
+        try:
+            return ImageFont.truetype(
+                settings.SHOPPING_LIST_PDF_FONT, PDF_FONT_SIZE)
+        except OSError:
+            # Шрифт по умолчанию не содержит кириллицы
+            return ImageFont.load_default()
+
+    def render_pages(self, lines):
+        font = self.get_font()
+        lines_per_page = (
+            (PDF_RASTER_SIZE[1] - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT)
+        for chunk in chunked(lines, lines_per_page):
+            page = Image.new('L', PDF_RASTER_SIZE, 255)
+            draw = ImageDraw.Draw(page)
+            for number, line in enumerate(chunk):
+                draw.text(
+                    (PDF_MARGIN, PDF_MARGIN + number * PDF_LINE_HEIGHT),
+                    line, fill=0, font=font
+                )
+            yield page
+
+    def stream_lines(self, lines):
+        # Объекты 1 и 2 (каталог и дерево страниц) пишутся в конце,
+        # когда известен список страниц
+        offsets = {}
+        position = 0
+        page_ids = []
+        next_id = 3
+
+        def write_object(object_id, body, stream=None):
+            nonlocal position
+            offsets[object_id] = position
+            data = f'{object_id} 0 obj\n'.encode() + body
+            if stream is not None:
+                data += b'\nstream\n' + stream + b'\nendstream'
+            data += b'\nendobj\n'
+            position += len(data)
+            return data
+
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        position += len(header)
+        yield header
+
+        width, height = PDF_RASTER_SIZE
+        for page in self.render_pages(lines):
+            image_id, content_id, page_id = next_id, next_id + 1, next_id + 2
+            next_id += 3
+            image = zlib.compress(page.tobytes())
+            content = (f'q {PDF_PAGE_SIZE[0]} 0 0 {PDF_PAGE_SIZE[1]} 0 0 cm '
+                       f'/Im0 Do Q').encode()
+            yield write_object(image_id, (
+                f'<< /Type /XObject /Subtype /Image /Width {width} '
+                f'/Height {height} /ColorSpace /DeviceGray '
+                f'/BitsPerComponent 8 /Filter /FlateDecode '
+                f'/Length {len(image)} >>').encode(), image)
+            yield write_object(content_id, (
+                f'<< /Length {len(content)} >>').encode(), content)
+            yield write_object(page_id, (
+                f'<< /Type /Page /Parent 2 0 R '
+                f'/MediaBox [0 0 {PDF_PAGE_SIZE[0]} {PDF_PAGE_SIZE[1]}] '
+                f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> '
+                f'/Contents {content_id} 0 R >>').encode())
+            page_ids.append(page_id)
+
+        kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+        yield write_object(2, (
+            f'<< /Type /Pages /Kids [{kids}] '
+            f'/Count {len(page_ids)} >>').encode())
+        yield write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref = [f'xref\n0 {next_id}\n', '0000000000 65535 f \n']
+        xref += [f'{offsets[object_id]:010d} 00000 n \n'
+                 for object_id in range(1, next_id)]
+        yield ''.join(xref).encode()
+        yield (f'trailer\n<< /Size {next_id} /Root 1 0 R >>\n'
+               f'startxref\n{position}\n%%EOF\n').encode()
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """
+    Формат из ?format= или Accept; если Accept не подходит ни одному
+    формату (например, application/json), отдается текстовый список,
+    как до появления форматов.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            renderer = renderers[0]
+            return renderer, renderer.media_type
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CsvShoppingListRenderer,
+    PdfShoppingListRenderer,
+)
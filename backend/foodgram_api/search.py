@@ -0,0 +1,97 @@
+"""
+Поиск продуктов по названию для автодополнения.
+
+Результаты ранжируются: сначала названия, начинающиеся с запроса,
+затем названия, содержащие запрос, внутри групп — по алфавиту.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+from recipes.models import Ingredient
+
+
+def search_ingredients(queryset, query, limit):
+    """Поиск силами базы данных (использует триграммный индекс)."""
+    return list(
+        queryset.filter(
+            name__icontains=query
+        ).annotate(
+            is_contains=Case(
+                When(name__istartswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('is_contains', 'name')[:limit]
+    )
+
+
+class IngredientIndex:
+    """
+    Индекс продуктов в памяти процесса: отсортированный массив
+    названий в нижнем регистре, поиск по префиксу через bisect.
+    Хранит весь справочник в каждом воркере, поэтому включается
+    настройкой INGREDIENT_SEARCH_INDEX только для небольших справочников.
+
+    Сбрасывается сигналами при сохранении и удалении продукта
+    и перестраивается не реже одного раза в INGREDIENT_SEARCH_INDEX_TTL
+    секунд, чтобы изменения из других процессов тоже попадали в индекс.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._ingredients = None
+        self._built_at = 0
+
+    def invalidate(self, **kwargs):
+        # Принимает **kwargs, чтобы подключаться как обработчик сигнала
+        with self._lock:
+            self._keys = None
+            self._ingredients = None
+
+    def _get_entries(self):
+        with self._lock:
+            expired = (
+                time.monotonic() - self._built_at
+                > settings.INGREDIENT_SEARCH_INDEX_TTL
+            )
+            if self._keys is None or expired:
+                ingredients = sorted(
+                    Ingredient.objects.all(),
+                    key=lambda ingredient: (ingredient.name.lower(),
+                                            ingredient.id)
+                )
+                self._keys = [
+                    ingredient.name.lower() for ingredient in ingredients]
+                self._ingredients = ingredients
+                self._built_at = time.monotonic()
+            return self._keys, self._ingredients
+
+    def search(self, query, limit):
+        keys, ingredients = self._get_entries()
+        query = query.lower()
+
+        # Совпадения по префиксу идут подряд начиная с позиции bisect,
+        # просматриваем не больше limit из них
+        start = end = bisect_left(keys, query)
+        stop = min(start + limit, len(keys))
+        while end < stop and keys[end].startswith(query):
+            end += 1
+        results = ingredients[start:end]
+
+        # Остаток лимита — вхождения в середине названия — ищет база
+        # по триграммному индексу, а не перебор всех названий в памяти
+        if len(results) < limit:
+            results += Ingredient.objects.filter(
+                name__icontains=query
+            ).exclude(
+                name__istartswith=query
+            ).order_by('name')[:limit - len(results)]
+        return results
+
+
+ingredient_index = IngredientIndex()
@@ -1,28 +1,152 @@
 import base64
-from django.core.files.base import ContentFile
+import binascii
+import os
+import tempfile
+import weakref
+from collections import Counter
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 from django.core.validators import MinValueValidator
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from djoser.serializers import UserSerializer
+from PIL import Image
 
-from recipes.models import Recipe, Ingredient, RecipeIngredient
+from recipes.images import get_srcset
+from recipes.models import (
+    Recipe, Ingredient, RecipeIngredient, ShoppingCartTotal)
 
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Предельное число рецептов автора в ответе, чтобы клиент
+# не мог запросить сериализацию всех рецептов через recipes_limit
+RECIPES_LIMIT_MAX = 100
+
+
+def get_recipes_limit(request):
+    """Возвращает значение recipes_limit, ограниченное сверху."""
+    try:
+        limit = int(request.query_params.get(
+            'recipes_limit', RECIPES_LIMIT_MAX))
+    except ValueError:
+        limit = RECIPES_LIMIT_MAX
+    return max(0, min(limit, RECIPES_LIMIT_MAX))
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # Хранилище уже переместило файл на место
+        pass
+
+
+class DecodedImageFile(UploadedFile):
+    """
+    Картинка, декодированная во временный файл на диске. Файл
+    удаляется при закрытии или сборке мусора, если хранилище
+    не переместило его при сохранении модели.
+    """
+
+    def __init__(self, name, content_type, size):
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR,
+            delete=False)
+        super().__init__(file, name, content_type, size, None)
+        self._finalizer = weakref.finalize(self, remove_file, file.name)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            self._finalizer()
+
 
 class Base64ImageField(serializers.ImageField):
+    """
+    Картинка в формате data:image/...;base64. Размер проверяется до
+    декодирования, содержимое декодируется блоками во временный файл,
+    а размеры в пикселях читаются из заголовка до полной распаковки.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные картинки в base64.',
+        'too_large': 'Размер картинки больше {max_size} МБ.',
+        'too_big': 'Сторона картинки больше {max_side} пикселей.',
+    }
+    # Кратно 4, чтобы блоки base64 декодировались независимо
+    DECODE_CHUNK_SIZE = 64 * 1024
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
+            self.check_dimensions(data)
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        header, _, payload = data.partition(';base64,')
+        if not payload:
+            self.fail('invalid_base64')
+        size = len(payload) * 3 // 4 - payload[-2:].count('=')
+        if size > settings.IMAGE_MAX_SIZE:
+            self.fail('too_large',
+                      max_size=settings.IMAGE_MAX_SIZE // 1024 ** 2)
+
+        ext = header.split('/')[-1]
+        file = DecodedImageFile(
+            'temp.' + ext, header[len('data:'):], size)
+        try:
+            for start in range(0, len(payload), self.DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    payload[start:start + self.DECODE_CHUNK_SIZE],
+                    validate=True))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return file
+
+    def check_dimensions(self, file):
+        try:
+            # Pillow читает только заголовок файла
+            with Image.open(file.temporary_file_path()) as image:
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        if max(width, height) > settings.IMAGE_MAX_SIDE:
+            self.fail('too_big', max_side=settings.IMAGE_MAX_SIDE)
+
+
+def build_srcset(serializer, file, renditions):
+    """
+    Карта srcset картинки: {'webp': 'url 240w, url 600w, ...',
+    'jpeg': ...}; None, пока уменьшенные копии не готовы.
+    """
+    srcset = get_srcset(file, renditions)
+    if srcset is None:
+        return None
+    request = serializer.context.get('request')
+    return {
+        extension: ', '.join(
+            '{} {}w'.format(
+                request.build_absolute_uri(file.storage.url(path))
+                if request else file.storage.url(path),
+                width
+            )
+            for path, width in paths
+        )
+        for extension, paths in srcset.items()
+    }
+
 
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -33,16 +157,23 @@ class CustomUserSerializer(UserSerializer):
             'first_name',
             'last_name',
             'avatar',
+            'avatar_srcset',
             'is_subscribed'
         )
 
     def get_is_subscribed(self, author):
+        # Флаг уже посчитан в запросе (аннотация queryset)
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context['request'].user
         is_authenticated = user.is_authenticated
         is_subscribed = user.users.filter(
             author=author).exists() if is_authenticated else False
         return is_authenticated and is_subscribed
 
+    def get_avatar_srcset(self, user):
+        return build_srcset(self, user.avatar, user.avatar_renditions)
+
 
 class AvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(required=True)
@@ -53,19 +184,33 @@ class AvatarSerializer(serializers.ModelSerializer):
 
 
 class RecipeBasicSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
         read_only_fields = fields
 
+    def get_image(self, recipe):
+        # Самая маленькая копия, пока копий нет — исходная картинка
+        srcset = get_srcset(recipe.image, recipe.image_renditions)
+        if srcset:
+            url = recipe.image.storage.url(srcset['jpeg'][0][0])
+        elif recipe.image:
+            url = recipe.image.url
+        else:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image_srcset(self, recipe):
+        return build_srcset(self, recipe.image, recipe.image_renditions)
+
 
 class UserDetailSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -79,17 +224,16 @@ class UserDetailSerializer(CustomUserSerializer):
             'recipes',
             'recipes_count',
             'avatar',
+            'avatar_srcset',
         )
 
     def get_recipes(self, user):
-        return RecipeBasicSerializer(
-            user.recipes.all()[:int(
-                self.context['request'].query_params.get(
-                    'recipes_limit', 10**10
-                )
-            )],
-            many=True
-        ).data
+        # Рецепты уже загружены для всей страницы (prefetch_recent_recipes)
+        recipes = getattr(user, 'recent_recipes', None)
+        if recipes is None:
+            recipes = user.recipes.all()[
+                :get_recipes_limit(self.context['request'])]
+        return RecipeBasicSerializer(recipes, many=True).data
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -100,9 +244,9 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-    )
+    # Существование продуктов проверяется одним запросом
+    # для всего рецепта в RecipeSerializer.validate
+    id = serializers.IntegerField()
     name = serializers.CharField(
         source='ingredient.name',
         read_only=True
@@ -131,6 +275,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         required=True
     )
     image = Base64ImageField(allow_null=True)
+    image_srcset = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField(validators=[MinValueValidator(1)])
 
     class Meta:
@@ -143,12 +288,16 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_srcset',
             'text',
             'cooking_time',
         )
         # Эти поля нельзя изменять через API
         read_only_fields = ('author', )
 
+    def get_image_srcset(self, recipe):
+        return build_srcset(self, recipe.image, recipe.image_renditions)
+
     def validate(self, data):
         if 'recipe_ingredients' not in data:
             raise ValidationError(
@@ -161,8 +310,9 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         ingredient_ids = [ingredient['id'] for ingredient in ingredients]
         duplicate_ids = [
-            ingredient_id for ingredient_id in set(ingredient_ids)
-            if ingredient_ids.count(ingredient_id) > 1
+            ingredient_id
+            for ingredient_id, count in Counter(ingredient_ids).items()
+            if count > 1
         ]
 
         if duplicate_ids:
@@ -171,23 +321,81 @@ class RecipeSerializer(serializers.ModelSerializer):
                                 f'Дубли: {duplicate_ids}'}
             )
 
-        return data
+        # Загружаем все продукты рецепта одним запросом
+        found = Ingredient.objects.in_bulk(ingredient_ids)
+        missing_ids = [
+            ingredient_id for ingredient_id in ingredient_ids
+            if ingredient_id not in found
+        ]
 
-    def save_recipe_ingredients(self, recipe, ingredients_data):
+        if missing_ids:
+            raise ValidationError(
+                {'ingredients': f'Продукты не найдены: {missing_ids}'}
+            )
+
+        for ingredient in ingredients:
+            ingredient['id'] = found[ingredient['id']]
 
-        # Удаляем старые ингредиенты
-        recipe.recipe_ingredients.all().delete()
+        return data
 
-        # Массовая вставка новых записей
-        RecipeIngredient.objects.bulk_create([
+    @transaction.atomic
+    def save_recipe_ingredients(self, recipe, ingredients_data):
+        # Текущие продукты рецепта (могут быть уже предзагружены)
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in existing.items()
+        }
+        new_amounts = {
+            ingredient_data['id'].id: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+
+        # Изменяем только то, что отличается: одно обновление
+        # количеств, одна вставка новых и одно удаление лишних записей
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            recipe_ingredient = existing.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+
+        created = [
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=ingredient_data['id'],
-                amount=ingredient_data['amount']
+                ingredient_id=ingredient_id,
+                amount=amount
             )
-            for ingredient_data in ingredients_data
-        ])
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in existing
+        ]
+        if created:
+            RecipeIngredient.objects.bulk_create(created)
 
+        removed = [
+            recipe_ingredient.id
+            for ingredient_id, recipe_ingredient in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+
+        # Переносим изменения состава в списки покупок с этим рецептом
+        ShoppingCartTotal.apply(
+            recipe.shoppingcarts.values_list('user_id', flat=True),
+            {
+                ingredient_id: (new_amounts.get(ingredient_id, 0)
+                                - old_amounts.get(ingredient_id, 0))
+                for ingredient_id in {*old_amounts, *new_amounts}
+            }
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
 
@@ -199,6 +407,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
 
@@ -208,7 +417,16 @@ class RecipeSerializer(serializers.ModelSerializer):
         # Обновляем основной объект
         return super().update(instance, validated_data)
 
+    def to_representation(self, recipe):
+        # Передаем аннотацию подписки в объект автора
+        if hasattr(recipe, 'is_subscribed'):
+            recipe.author.is_subscribed = recipe.is_subscribed
+        return super().to_representation(recipe)
+
     def get_is_favorited(self, recipe):
+        # Флаг уже посчитан в запросе (аннотация queryset)
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context['request'].user
         is_authenticated = user.is_authenticated
         is_favorited = user.favoriterecipes.filter(
@@ -216,6 +434,9 @@ class RecipeSerializer(serializers.ModelSerializer):
         return is_authenticated and is_favorited
 
     def get_is_in_shopping_cart(self, recipe):
+        # Флаг уже посчитан в запросе (аннотация queryset)
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context['request'].user
         is_authenticated = user.is_authenticated
         is_favorited = user.shoppingcarts.filter(
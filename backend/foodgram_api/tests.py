@@ -1,3 +1,994 @@
-# from django.test import TestCase
+import base64
+import csv
+import io
+import os
+import re
+import runpy
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime, timezone
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from PIL import Image
+
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from foodgram_backend.metrics import Histogram
+from foodgram_backend.nplusone import NPlusOneTestMixin, collect_queries
+from recipes.models import (
+    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    Subscribe)
+
+from . import cache as response_cache
+from . import urls as api_urls
+from .async_views import with_async_views
+from .benchmark import make_client, measure
+from .pagination import LimitPageNumberPagination, estimate_count
+from .search import ingredient_index, search_ingredients
+from .serializers import RecipeSerializer
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(size=(1, 1)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class NPlusOneTests(NPlusOneTestMixin, TestCase):
+    """Страницы API не должны выполнять запросы в цикле по объектам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create(
+                email=f'author{i}@example.com', username=f'author{i}',
+                first_name='Автор', last_name=str(i))
+            for i in range(4)
+        ]
+        cls.user = cls.authors[0]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'продукт {i}', measurement_unit='г')
+            for i in range(10)
+        )
+        cls.ingredients = list(Ingredient.objects.all())
+        cls.recipes = []
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.authors[i % 4], name=f'рецепт {i}',
+                image='recipes_images/test.png', text='текст',
+                cooking_time=10)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[(i + j) % 10],
+                    amount=j + 1)
+                for j in range(3)
+            )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.authors[1:]:
+            Subscribe.objects.create(user=cls.user, author=author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Кэш ответов и фрагментов скрыл бы запросы сериализаторов
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, client, url):
+        with self.assertNoNPlusOne():
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_detector_finds_n_plus_one(self):
+        with collect_queries() as collector:
+            for recipe in Recipe.objects.all():
+                recipe.author.username
+        self.assertTrue(collector.repeated())
+
+    def test_recipe_list(self):
+        for url in (
+            '/api/recipes/?limit=10',
+            '/api/recipes/?limit=10&cursor=',
+            f'/api/recipes/?limit=10&author={self.authors[1].id}',
+        ):
+            self.get(self.anonymous, url)
+            self.get(self.client, url)
+        self.get(self.client, '/api/recipes/?limit=10&is_favorited=1')
+        self.get(self.client, '/api/recipes/?limit=10&is_in_shopping_cart=1')
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.get(self.anonymous, url)
+        self.get(self.client, url)
+
+    def test_users(self):
+        self.get(self.anonymous, '/api/users/')
+        self.get(self.client, '/api/users/')
+        self.get(self.client, '/api/users/me/')
+        self.get(self.client, '/api/users/subscriptions/?recipes_limit=2')
+
+    def test_ingredients(self):
+        self.get(self.anonymous, '/api/ingredients/')
+        self.get(self.anonymous, '/api/ingredients/?name=прод')
+
+    def test_download_shopping_cart(self):
+        for file_format in ('txt', 'csv'):
+            self.get(
+                self.client,
+                f'/api/recipes/download_shopping_cart/?format={file_format}')
+
+    def test_recipe_create_and_update(self):
+        data = {
+            'name': 'новый рецепт',
+            'text': 'текст',
+            'cooking_time': 5,
+            'image': make_image(),
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients[:8]
+            ],
+        }
+        with self.assertNoNPlusOne():
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        data['ingredients'] = [
+            {'id': ingredient.id, 'amount': 20}
+            for ingredient in self.ingredients[2:]
+        ]
+        with self.assertNoNPlusOne():
+            response = self.client.patch(
+                f'/api/recipes/{response.data["id"]}/', data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+
+class Base64ImageFieldTests(TestCase):
+    """Отклоненная картинка не оставляет файлов ни в media, ни во временных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='Пользователь', last_name='Пользователев')
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.temp_dir = tempfile.mkdtemp()
+        for directory in (self.media_root, self.temp_dir):
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertRejected(self, avatar, **settings):
+        with override_settings(MEDIA_ROOT=self.media_root,
+                               FILE_UPLOAD_TEMP_DIR=self.temp_dir,
+                               **settings):
+            response = self.client.put(
+                '/api/users/me/avatar/', {'avatar': avatar}, format='json')
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertIn('avatar', response.data)
+        self.assertEqual(os.listdir(self.media_root), [])
+        self.assertEqual(os.listdir(self.temp_dir), [])
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    def test_oversized_payload(self):
+        self.assertRejected(make_image(), IMAGE_MAX_SIZE=10)
+
+    def test_too_many_pixels(self):
+        self.assertRejected(make_image((20, 10)), IMAGE_MAX_SIDE=16)
+
+    def test_malformed_base64(self):
+        self.assertRejected('data:image/png;base64,!!!!')
+        self.assertRejected('data:image/png;base64,')
+
+    def test_not_an_image(self):
+        self.assertRejected(
+            'data:image/png;base64,'
+            + base64.b64encode(b'not an image').decode())
+
+
+class ShoppingListDownloadTests(TestCase):
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = [
+            User.objects.create(
+                email=f'user{i}@example.com', username=f'user{i}',
+                first_name='Пользователь', last_name=str(i))
+            for i in range(2)
+        ]
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        sugar = Ingredient.objects.create(name='сахар', measurement_unit='г')
+        for name, amounts in (('суп', {salt: 5, sugar: 10}),
+                              ('каша', {salt: 3})):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=name, image='recipes_images/test.png',
+                text='текст', cooking_time=10)
+            for ingredient, amount in amounts.items():
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, query='', **extra):
+        response = self.client.get(self.URL + query, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_txt_sums_amounts(self):
+        for query, extra in (('', {}), ('?format=txt', {}),
+                             ('', {'HTTP_ACCEPT': 'application/json'})):
+            response, content = self.download(query, **extra)
+            self.assertEqual(
+                response['Content-Type'], 'text/plain; charset=utf-8')
+            lines = content.decode().splitlines()
+            self.assertTrue(lines[0].startswith('Список покупок'), lines)
+            self.assertEqual(lines[1:4], [
+                '1. Сахар - 10 г',
+                '2. Соль - 8 г',
+                'Для следующих рецептов:',
+            ])
+            self.assertEqual(sorted(lines[4:]), ['- каша', '- суп'])
+
+    def test_csv(self):
+        response, content = self.download('?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(
+            response['Content-Disposition'].endswith('.csv"'))
+        self.assertEqual(list(csv.reader(io.StringIO(content.decode()))), [
+            ['№', 'Продукт', 'Количество', 'Единица измерения'],
+            ['1', 'сахар', '10', 'г'],
+            ['2', 'соль', '8', 'г'],
+        ])
+
+    def test_pdf(self):
+        response, content = self.download('?format=pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-1.4\n'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        # startxref указывает на таблицу, а та — на начало каждого объекта
+        xref = int(content.rsplit(b'startxref\n', 1)[1].split()[0])
+        table = content[xref:].split(b'trailer')[0].splitlines()
+        self.assertEqual(table[0], b'xref')
+        size = int(table[1].split()[1])
+        self.assertEqual(len(table), size + 2)
+        for object_id, entry in enumerate(table[3:], start=1):
+            offset = int(entry.split()[0])
+            self.assertTrue(
+                content[offset:].startswith(f'{object_id} 0 obj'.encode()),
+                object_id)
+
+    def test_empty_cart(self):
+        self.client.force_authenticate(self.other)
+        _, content = self.download()
+        self.assertEqual(content.decode(), 'Список покупок пуст.\n')
+        _, content = self.download('?format=csv')
+        self.assertEqual(
+            content.decode().splitlines(),
+            ['№,Продукт,Количество,Единица измерения'])
+        _, content = self.download('?format=pdf')
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+
+
+class RecipeListQueriesTests(TestCase):
+    """Число запросов ленты рецептов не зависит от числа рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            User.objects.create(
+                email=f'author{i}@example.com', username=f'author{i}',
+                first_name='Автор', last_name=str(i))
+            for i in range(3)
+        ]
+        cls.user = authors[0]
+        ingredient = Ingredient.objects.create(
+            name='продукт', measurement_unit='г')
+        for i in range(10):
+            recipe = Recipe.objects.create(
+                author=authors[i % 3], name=f'рецепт {i}',
+                image='recipes_images/test.png', text='текст',
+                cooking_time=10)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=i + 1)
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in authors[1:]:
+            Subscribe.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        # Ответ из кэша не выполнил бы запросов к базе
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(context.captured_queries)
+
+    def test_queries_do_not_grow_with_page_size(self):
+        for client in (self.anonymous, self.client):
+            expected = self.count_queries(client, '/api/recipes/?limit=1')
+            with self.assertNumQueries(expected):
+                client.get('/api/recipes/?limit=10')
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=300)
+    def test_cached_response_is_invalidated(self):
+        url = '/api/recipes/?limit=10'
+        expected = self.anonymous.get(url).content
+        with self.assertNumQueries(0):
+            self.assertEqual(self.anonymous.get(url).content, expected)
+        # Версии меняются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.first().save()
+        self.assertGreater(self.count_queries(self.anonymous, url), 0)
+
+    def test_fragments_match_uncached_response(self):
+        url = '/api/recipes/?limit=10'
+        expected = self.client.get(url).json()
+        with override_settings(RECIPE_FRAGMENT_CACHE_TIMEOUT=3600):
+            # Первый запрос заполняет кэш, второй собирает ответ из него
+            for _ in range(2):
+                self.assertEqual(self.client.get(url).json(), expected)
+
+    # Список из фрагментов выполняет на запрос больше: id страницы
+    # и недостающие рецепты загружаются отдельно
+    @override_settings(RECIPE_FRAGMENT_CACHE_TIMEOUT=0)
+    def test_user_flags_do_not_add_queries(self):
+        # Флаги считаются в основном запросе: пользователю нужно
+        # столько же запросов, сколько анонимному, на любой странице
+        for limit in (1, 10):
+            url = f'/api/recipes/?limit={limit}'
+            with self.assertNumQueries(
+                    self.count_queries(self.anonymous, url)):
+                response = self.client.get(url)
+            for recipe in response.data['results']:
+                self.assertTrue(recipe['is_favorited'])
+                self.assertTrue(recipe['is_in_shopping_cart'])
+                self.assertEqual(
+                    recipe['author']['is_subscribed'],
+                    recipe['author']['id'] != self.user.id)
+
+
+class RoundTripCache(LocMemCache):
+    """Кэш в памяти, который записывает обращения к нему (без вложенных)."""
+    calls = []
+
+    def record(name):
+        def method(self, *args, **kwargs):
+            outer = not getattr(self, 'in_call', False)
+            if outer:
+                self.calls.append(name)
+                self.in_call = True
+            try:
+                return getattr(LocMemCache, name)(self, *args, **kwargs)
+            finally:
+                if outer:
+                    self.in_call = False
+        return method
+
+    get = record('get')
+    get_many = record('get_many')
+    set = record('set')
+    set_many = record('set_many')
+    add = record('add')
+    incr = record('incr')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': f'{__name__}.RoundTripCache'}})
+class FragmentKeysTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        RoundTripCache.calls.clear()
+        self.request = APIRequestFactory().get('/api/recipes/')
+
+    def test_round_trips(self):
+        ids = range(1, 11)
+        keys = response_cache.fragment_keys(self.request, ids)
+        # Холодный кэш: одно чтение и одна запись всех версий
+        self.assertEqual(RoundTripCache.calls, ['get_many', 'set_many'])
+
+        RoundTripCache.calls.clear()
+        self.assertEqual(response_cache.fragment_keys(self.request, ids), keys)
+        self.assertEqual(RoundTripCache.calls, ['get_many'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response_cache.bump_version(
+                response_cache.RECIPE_VERSION_KEY.format(pk=3))
+        changed = response_cache.fragment_keys(self.request, ids)
+        self.assertEqual(
+            [pk for pk in ids if changed[pk] != keys[pk]], [3])
+
+
+class RecipeCursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        for i in range(8):
+            Recipe.objects.create(
+                author=author, name=f'рецепт {i}',
+                image='recipes_images/test.png', text='текст',
+                cooking_time=10)
+        # Группы рецептов с одинаковым временем публикации
+        recipes = list(Recipe.objects.order_by('id'))
+        for i, recipe in enumerate(recipes):
+            Recipe.objects.filter(id=recipe.id).update(
+                pub_date=datetime(2024, 1, 1 + i // 3, tzinfo=timezone.utc))
+        cls.expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.data
+
+    def test_next_and_previous_cursors(self):
+        pages = []
+        url = '/api/recipes/?cursor=&limit=3'
+        while url:
+            data = self.get(url)
+            pages.append([recipe['id'] for recipe in data['results']])
+            last_url, url = url, data['next']
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+
+        # Обратно по ссылкам previous с последней страницы
+        backwards = []
+        url = self.get(last_url)['previous']
+        while url:
+            data = self.get(url)
+            backwards.insert(0, [recipe['id'] for recipe in data['results']])
+            url = data['previous']
+        self.assertEqual(backwards, pages[:-1])
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', '!!!',
+                       base64.urlsafe_b64encode(b'0|2024-01-01|x').decode(),
+                       base64.urlsafe_b64encode(b'1|2024-13-01|1').decode(),
+                       base64.urlsafe_b64encode(b'\xff\xfe').decode()):
+            response = self.client.get(f'/api/recipes/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_count_is_estimated(self):
+        data = self.get('/api/recipes/?cursor=')
+        self.assertEqual(data['count'], estimate_count(Recipe.objects.all()))
+        if connection.vendor != 'postgresql':
+            self.assertIsNone(data['count'])
+        # Для отфильтрованной выборки число не считается
+        self.assertIsNone(self.get(
+            f'/api/recipes/?cursor=&author={User.objects.get().id}')['count'])
+
+
+class SubscriptionsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *authors = [
+            User.objects.create(
+                email=f'user{i}@example.com', username=f'user{i}',
+                first_name='Пользователь', last_name=str(i))
+            for i in range(3)
+        ]
+        for author in authors:
+            Subscribe.objects.create(user=cls.user, author=author)
+            for i in range(3):
+                Recipe.objects.create(
+                    author=author, name=f'рецепт {i}',
+                    image='recipes_images/test.png', text='текст',
+                    cooking_time=10)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_recent_recipes(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        for author in response.data['results']:
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(author['recipes_count'], 3)
+
+    def test_limit_is_validated(self):
+        self.client.force_authenticate(self.user)
+        for limit, expected in (('1', 1), ('abc', 2), ('0', 2)):
+            response = self.client.get(
+                f'/api/users/subscriptions/?limit={limit}')
+            self.assertEqual(response.status_code, 200, limit)
+            self.assertEqual(
+                len(response.data['results']), expected, limit)
+        request = Request(APIRequestFactory().get('/?limit=100000'))
+        paginator = LimitPageNumberPagination()
+        self.assertEqual(
+            paginator.get_page_size(request), paginator.max_page_size)
+
+    def test_no_subscriptions(self):
+        self.client.force_authenticate(
+            User.objects.exclude(id=self.user.id).first())
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+
+class IngredientSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('соль', 'соль морская', 'солод', 'фасоль',
+                         'фасоль красная', 'сахар'))
+
+    def search(self, query, limit):
+        ingredient_index.invalidate()
+        with CaptureQueriesContext(connection) as context:
+            results = ingredient_index.search(query, limit)
+        return [ingredient.name for ingredient in results], context
+
+    def test_index_matches_database_search(self):
+        for limit in (1, 3, 10):
+            expected = [
+                ingredient.name for ingredient in search_ingredients(
+                    Ingredient.objects.all(), 'сол', limit)
+            ]
+            self.assertEqual(self.search('сол', limit)[0], expected, limit)
+
+    def test_substring_matches_are_queried_only_when_needed(self):
+        names, context = self.search('со', 3)
+        self.assertEqual(names, ['солод', 'соль', 'соль морская'])
+        # Только построение индекса
+        self.assertEqual(len(context.captured_queries), 1)
+        names, context = self.search('оль', 10)
+        self.assertEqual(names, ['соль', 'соль морская', 'фасоль',
+                                 'фасоль красная'])
+        self.assertEqual(len(context.captured_queries), 2)
+
+
+class RecipeIngredientsUpdateTests(TestCase):
+    """Изменение рецепта записывает только изменившиеся продукты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'продукт {i}', measurement_unit='г')
+            for i in range(6)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='рецепт', image='recipes_images/test.png',
+            text='текст', cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=10)
+            for ingredient in cls.ingredients[:4]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def patch_ingredients(self, amounts):
+        """
+        Меняет продукты рецепта ({продукт: количество}) и возвращает
+        число INSERT, UPDATE и DELETE таблицы продуктов рецепта.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                {'ingredients': [
+                    {'id': ingredient.id, 'amount': amount}
+                    for ingredient, amount in amounts.items()
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        statement = re.compile(
+            r'^(INSERT|UPDATE|DELETE)\b.*?"{}"'.format(
+                RecipeIngredient._meta.db_table))
+        return Counter(
+            match.group(1) for match in (
+                statement.match(query['sql'])
+                for query in context.captured_queries
+            ) if match
+        )
+
+    def test_unchanged_ingredients_are_not_written(self):
+        self.assertEqual(self.patch_ingredients(
+            {ingredient: 10 for ingredient in self.ingredients[:4]}), {})
+
+    def test_one_statement_per_kind_of_change(self):
+        first, second, third, removed, *added = self.ingredients
+        amounts = {first: 20, second: 30, third: 10, added[0]: 1,
+                   added[1]: 2}
+        self.assertEqual(
+            self.patch_ingredients(amounts),
+            {'INSERT': 1, 'UPDATE': 1, 'DELETE': 1})
+        self.assertEqual(
+            dict(self.recipe.recipe_ingredients.values_list(
+                'ingredient_id', 'amount')),
+            {ingredient.id: amount for ingredient, amount in amounts.items()})
+
+
+class RecipeIngredientsValidationTests(TestCase):
+    """Проверка продуктов рецепта: дубли, несуществующие id, один запрос."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'продукт {i}', measurement_unit='г')
+            for i in range(10)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='рецепт', image='recipes_images/test.png',
+            text='текст', cooking_time=10)
+
+    def validate(self, ingredient_ids):
+        serializer = RecipeSerializer(
+            self.recipe, partial=True,
+            data={'ingredients': [
+                {'id': ingredient_id, 'amount': 1}
+                for ingredient_id in ingredient_ids
+            ]}
+        )
+        serializer.is_valid()
+        return serializer
+
+    def test_duplicates_are_reported(self):
+        first, second, third = (
+            ingredient.id for ingredient in self.ingredients[:3])
+        with self.assertNumQueries(0):
+            serializer = self.validate([first, second, first, third, second])
+        self.assertEqual(
+            serializer.errors['ingredients'],
+            [f'Ингредиенты не должны повторяться. Дубли: {[first, second]}'])
+
+    def test_missing_ids_are_reported_together(self):
+        last_id = self.ingredients[-1].id
+        ids = [self.ingredients[0].id, last_id + 1, last_id + 2]
+        with self.assertNumQueries(1):
+            serializer = self.validate(ids)
+        self.assertEqual(
+            serializer.errors['ingredients'],
+            [f'Продукты не найдены: {[last_id + 1, last_id + 2]}'])
+
+    def test_ingredients_are_loaded_in_one_query(self):
+        for ingredients in (self.ingredients[:1], self.ingredients):
+            with self.assertNumQueries(1):
+                serializer = self.validate(
+                    [ingredient.id for ingredient in ingredients])
+            self.assertEqual(serializer.errors, {})
+            self.assertEqual(
+                [item['id'] for item
+                 in serializer.validated_data['recipe_ingredients']],
+                ingredients)
+
+
+class ExplainQueriesTests(TestCase):
+    """
+    Проверка индексов на базе тестов: в продакшен-настройках это
+    PostgreSQL, локально поддерживается и SQLite.
+    """
+
+    def test_hot_queries_use_indexes(self):
+        output = io.StringIO()
+        call_command('explain_queries', recipes=200, stdout=output)
+        self.assertIn('Все запросы используют индексы.', output.getvalue())
+
+
+class BenchmarkClientTests(TestCase):
+    def test_allowed_hosts_patterns(self):
+        for allowed_hosts in (['*'], ['.example.com'], ['', 'localhost']):
+            with self.subTest(allowed_hosts=allowed_hosts), \
+                    override_settings(ALLOWED_HOSTS=allowed_hosts):
+                response = make_client().get('/api/recipes/')
+                self.assertEqual(response.status_code, 200)
+
+    def test_measure_fails_on_error_status(self):
+        client = make_client()
+        result = measure(client, '/api/recipes/', repeat=2)
+        self.assertEqual(result['status'], 200)
+        with self.assertRaisesMessage(CommandError,
+                                      'GET /api/recipes/0/: ответ 404'):
+            measure(client, '/api/recipes/0/', repeat=2)
+
+
+class GunicornCpuCountTests(SimpleTestCase):
+    """Число ядер в gunicorn.conf.py по квоте cgroup контейнера."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cpu_count = staticmethod(runpy.run_path(
+            str(settings.BASE_DIR / 'gunicorn.conf.py'))['cpu_count'])
+        cls.host_count = cls.cpu_count(os.devnull)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def count(self, **files):
+        for name, content in files.items():
+            path = os.path.join(self.root, *name.split('__'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(content)
+        return self.cpu_count(self.root)
+
+    def test_cgroup_v2(self):
+        self.assertEqual(self.count(**{'cpu.max': 'max 100000\n'}),
+                         self.host_count)
+        self.assertEqual(self.count(**{'cpu.max': '50000 100000\n'}), 1)
+
+    def test_cgroup_v2_rounds_up(self):
+        self.assertEqual(self.count(**{'cpu.max': '150000 100000\n'}),
+                         min(self.host_count, 2))
+
+    def test_cgroup_v1(self):
+        files = {'cpu__cpu.cfs_period_us': '100000\n'}
+        self.assertEqual(
+            self.count(**files, **{'cpu__cpu.cfs_quota_us': '-1\n'}),
+            self.host_count)
+        self.assertEqual(
+            self.count(**files, **{'cpu__cpu.cfs_quota_us': '100000\n'}), 1)
+
+    def test_malformed_files(self):
+        self.assertEqual(self.count(**{'cpu.max': 'max\n'}),
+                         self.host_count)
+        # Неполный cpu.max пропускается, используется квота cgroup v1
+        self.assertEqual(self.count(**{
+            'cpu__cpu.cfs_quota_us': '50000\n',
+            'cpu__cpu.cfs_period_us': '100000\n',
+        }), 1)
+
+
+class SeedLoadDataTests(TestCase):
+    OPTIONS = {'users': 12, 'recipes': 40, 'min_ingredients': 2,
+               'max_ingredients': 4, 'favorites': 3, 'carts': 2,
+               'subscriptions': 2, 'batch_size': 7}
+
+    def seed(self, **options):
+        output = io.StringIO()
+        call_command('seed_load_data', stdout=output,
+                     **{**self.OPTIONS, **options})
+        return output.getvalue()
+
+    def test_row_counts(self):
+        self.seed()
+        self.assertEqual(
+            User.objects.filter(username__startswith='load-').count(), 12)
+        self.assertEqual(Recipe.objects.count(), 40)
+        for recipe in Recipe.objects.annotate(
+                ingredients_total=Count('recipe_ingredients')):
+            self.assertTrue(2 <= recipe.ingredients_total <= 4)
+        self.assertTrue(FavoriteRecipe.objects.exists())
+        self.assertTrue(ShoppingCart.objects.exists())
+        self.assertFalse(
+            Subscribe.objects.filter(user=F('author')).exists())
+
+    def test_counters_reconciled(self):
+        self.seed()
+        # Счетчики и итоги пересчитаны после массовой вставки
+        call_command('reconcile_counters', '--check', stdout=io.StringIO())
+        call_command('rebuild_shopping_cart_totals', '--check',
+                     stdout=io.StringIO())
+        self.assertEqual(
+            Recipe.objects.aggregate(total=Sum('favorites_count'))['total'],
+            FavoriteRecipe.objects.count())
+        self.assertEqual(
+            User.objects.aggregate(total=Sum('recipes_count'))['total'], 40)
+
+    def test_reproducible(self):
+        def relations(prefix):
+            return sorted(
+                FavoriteRecipe.objects.filter(
+                    user__username__startswith=prefix
+                ).values_list('user__last_name', 'recipe__name'))
+
+        self.seed(prefix='first')
+        self.seed(prefix='second')
+        self.assertEqual(
+            relations('first-'),
+            sorted((user, name.replace('second-', 'first-', 1))
+                   for user, name in relations('second-')))
+
+    def test_existing_prefix(self):
+        self.seed()
+        with self.assertRaisesMessage(CommandError, 'уже есть'):
+            self.seed()
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+    def metrics(self, **extra):
+        return self.client.get('/metrics/', **extra)
+
+    def sample(self, text, line_prefix):
+        for line in text.splitlines():
+            if line.startswith(line_prefix + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_histogram_buckets(self):
+        histogram = Histogram('queries', 'Запросы', (0, 1, 5))
+        labels = (('view', 'list'),)
+        for value in (0, 3, 7):
+            histogram.observe(labels, value)
+        self.assertEqual(list(histogram.render()), [
+            '# HELP queries Запросы',
+            '# TYPE queries histogram',
+            'queries_bucket{view="list",le="0"} 1',
+            'queries_bucket{view="list",le="1"} 1',
+            'queries_bucket{view="list",le="5"} 2',
+            'queries_bucket{view="list",le="+Inf"} 3',
+            'queries_sum{view="list"} 10',
+            'queries_count{view="list"} 3',
+        ])
+
+    def test_middleware_records_requests(self):
+        auth = {'HTTP_AUTHORIZATION': 'Bearer secret'}
+        counter = ('foodgram_requests_total'
+                   '{view="RecipeViewSet.list",status="200"}')
+        queries = 'foodgram_db_queries_count{view="RecipeViewSet.list"}'
+        before = self.metrics(**auth).content.decode()
+        for _ in range(2):
+            self.assertEqual(
+                self.client.get('/api/recipes/').status_code, 200)
+        after = self.metrics(**auth).content.decode()
+        self.assertEqual(
+            self.sample(after, counter) - self.sample(before, counter), 2)
+        self.assertEqual(
+            self.sample(after, queries) - self.sample(before, queries), 2)
+        self.assertIn(
+            '# TYPE foodgram_request_duration_seconds histogram', after)
+
+    def test_server_timing_header(self):
+        for enabled in (True, False):
+            with self.subTest(enabled=enabled), \
+                    override_settings(SERVER_TIMING_HEADER=enabled):
+                response = self.client.get('/api/recipes/')
+                self.assertEqual(response.has_header('Server-Timing'),
+                                 enabled)
+        with override_settings(SERVER_TIMING_HEADER=True):
+            header = self.client.get('/api/recipes/')['Server-Timing']
+        self.assertRegex(header, r'^db;dur=[\d.]+;desc="SQL: \d+", ')
+
+    def test_token_required(self):
+        for auth, status in (
+            (None, 403),
+            ('Bearer wrong', 403),
+            ('secret', 403),
+            ('Bearer secret', 200),
+        ):
+            with self.subTest(auth=auth):
+                response = self.metrics(
+                    **({'HTTP_AUTHORIZATION': auth} if auth else {}))
+                self.assertEqual(response.status_code, status)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_disabled_without_token(self):
+        response = self.metrics(HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncUrlconf:
+    """Адреса API в режиме ASGI (ASYNC_VIEWS)."""
+    urlpatterns = [
+        path('api/', include(with_async_views(api_urls.urlpatterns))),
+    ]
+
+
+class AsyncViewsTests(TransactionTestCase):
+    """
+    Асинхронные представления отвечают так же, как синхронные.
+    Потоки пула работают со своими соединениями и видят только
+    зафиксированные данные, поэтому TransactionTestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        self.token = Token.objects.create(user=self.user)
+        ingredient = Ingredient.objects.create(
+            name='продукт', measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='рецепт', image='', text='текст',
+            cooking_time=10)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=5)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+
+    async def async_get(self, url, **extra):
+        return await self.async_client.get(url, **extra)
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_responses_match_sync_views(self):
+        token = f'Token {self.token.key}'
+        for url, auth in (
+            ('/api/recipes/?limit=6', False),
+            ('/api/recipes/?limit=6', True),
+            (f'/api/recipes/{self.recipe.id}/', False),
+            (f'/api/recipes/{self.recipe.id}/get-link/', False),
+            ('/api/recipes/999999/get-link/', False),
+            ('/api/ingredients/?name=прод', False),
+            ('/api/recipes/download_shopping_cart/?format=csv', True),
+            (f'/api/s/{self.recipe.id}/', False),
+            ('/api/s/999999/', False),
+        ):
+            expected = self.client.get(
+                url, **({'HTTP_AUTHORIZATION': token} if auth else {}))
+            cache.clear()
+            with override_settings(ROOT_URLCONF=AsyncUrlconf):
+                response = async_to_sync(self.async_get)(
+                    url, **({'authorization': token} if auth else {}))
+            self.assertEqual(
+                response.status_code, expected.status_code, url)
+            # Потоковый ответ собирается в пуле потоков
+            self.assertFalse(response.streaming, url)
+            self.assertEqual(
+                response.content,
+                b''.join(expected.streaming_content) if expected.streaming
+                else expected.content,
+                url)
+            # Запросы из потоков пула учитываются в метриках
+            self.assertNotIn('SQL: 0', response['Server-Timing'], url)
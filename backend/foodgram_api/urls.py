@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 
 from rest_framework.routers import DefaultRouter
 
 from .views import RecipeViewSet, IngredientViewSet, CustomUserViewSet
-from .views import recipe_redirect_view
+from .views import CacheStatsView, recipe_redirect_view
+from .async_views import with_async_views
 
 router = DefaultRouter()
 router.register(r'recipes', RecipeViewSet, basename='recipes')
@@ -13,5 +15,10 @@ router.register(r'users', CustomUserViewSet, basename='users')
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
-    path('s/<int:recipe_id>/', recipe_redirect_view, name='recipe_redirect')
+    path('s/<int:recipe_id>/', recipe_redirect_view, name='recipe_redirect'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache_stats')
 ]
+
+# В режиме ASGI представления чтения асинхронные (async_views.py)
+if settings.ASYNC_VIEWS:
+    urlpatterns = with_async_views(urlpatterns)
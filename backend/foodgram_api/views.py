@@ -1,19 +1,22 @@
 from datetime import datetime
-from io import BytesIO
 
-from django.db.models import OuterRef, Exists, F, Sum
+from django.db.models import (
+    BooleanField, OuterRef, Exists, F, Prefetch, Value,
+    Window, prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.http import FileResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
 from rest_framework import status, viewsets
-from rest_framework.pagination import (
-    LimitOffsetPagination, PageNumberPagination)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import (
-    IsAuthenticated, IsAuthenticatedOrReadOnly)
+    IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly)
 from rest_framework.views import APIView
 
 from djoser.views import UserViewSet
@@ -27,6 +30,8 @@ from recipes.models import (
     RecipeIngredient
 )
 
+from . import cache as response_cache
+from .pagination import LimitPageNumberPagination, RecipePagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (
     RecipeSerializer,
@@ -34,15 +39,46 @@ from .serializers import (
     AvatarSerializer,
     RecipeBasicSerializer,
     UserDetailSerializer,
-    CustomUserSerializer
+    CustomUserSerializer,
+    get_recipes_limit
 )
 
-from .renderers import render_shopping_list
+from .renderers import SHOPPING_LIST_RENDERERS, ShoppingListNegotiation
+from .search import ingredient_index, search_ingredients
 
 
 User = get_user_model()
 
 
+def prefetch_recent_recipes(authors, limit):
+    """
+    Загружает одним запросом не более limit последних рецептов
+    каждого автора в атрибут recent_recipes.
+    """
+    if not authors:
+        # Пустой фильтр author__in нельзя превратить в SQL
+        return
+    # Нумеруем рецепты внутри каждого автора от новых к старым
+    ranked = Recipe.objects.filter(author__in=authors).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=[F('pub_date').desc(), F('id').desc()]
+        )
+    ).order_by().values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+
+    prefetch_related_objects(authors, Prefetch(
+        'recipes',
+        queryset=Recipe.objects.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.row_number <= %s',
+            (*params, limit)
+        )),
+        to_attr='recent_recipes'
+    ))
+
+
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
@@ -110,16 +146,19 @@ class CustomUserViewSet(UserViewSet):
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        user = request.user
-
-        subscriptions = user.users.all()
-        users = [subscription.author for subscription in subscriptions]
+        # Авторы, на которых подписан пользователь;
+        # пагинация выполняется на стороне базы данных
+        authors = User.objects.filter(
+            authors__user=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('username')
 
-        # Пагинация пользователей
-        paginator = PageNumberPagination()
-        # По умолчанию 10 объектов на странице
-        paginator.page_size = request.GET.get('limit', 10)
-        paginated_users = paginator.paginate_queryset(users, request)
+        # Пагинация пользователей: по умолчанию 10 на странице,
+        # размер из ?limit= ограничен сверху
+        paginator = LimitPageNumberPagination()
+        paginated_users = paginator.paginate_queryset(authors, request)
+        prefetch_recent_recipes(paginated_users, get_recipes_limit(request))
 
         return paginator.get_paginated_response(
             UserDetailSerializer(
@@ -135,23 +174,41 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     pagination_class = None
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-
+    def list(self, request, *args, **kwargs):
         # Получаем параметр 'name' из запроса
-        name_param = self.request.query_params.get('name', None)
+        name_param = request.query_params.get('name', None)
+        if not name_param:
+            return super().list(request, *args, **kwargs)
 
-        if name_param:
-            # Фильтруем ингредиенты, чье имя начинается с 'name_param'
-            queryset = queryset.filter(name__istartswith=name_param)
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.INGREDIENT_SEARCH_LIMIT))
+        except ValueError:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        limit = max(1, min(limit, settings.INGREDIENT_SEARCH_LIMIT))
 
-        return queryset
+        # Сначала продукты, чье имя начинается с 'name_param',
+        # затем содержащие его
+        if settings.INGREDIENT_SEARCH_INDEX:
+            ingredients = ingredient_index.search(name_param, limit)
+        else:
+            ingredients = search_ingredients(
+                self.get_queryset(), name_param, limit)
+
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+    # Автор и продукты рецепта загружаются заранее, а не на каждую строку
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        )
+    )
     serializer_class = RecipeSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = RecipePagination
     permission_classes = (IsAuthorOrReadOnly, IsAuthenticatedOrReadOnly)
 
     def get_queryset(self):
@@ -159,33 +216,49 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         queryset = super().get_queryset()
 
+        # Флаги текущего пользователя считаем в основном запросе,
+        # чтобы сериализатор не делал отдельных запросов на каждый рецепт
         if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    FavoriteRecipe.objects.filter(
+                        user=user,
+                        recipe=OuterRef('pk')
+                    )
+                ),
+                is_in_shopping_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        user=user,
+                        recipe=OuterRef('pk')
+                    )
+                ),
+                is_subscribed=Exists(
+                    Subscribe.objects.filter(
+                        user=user,
+                        author=OuterRef('author')
+                    )
+                )
+            )
+
+            # Фильтрация по is_favorited
             is_favorited = self.request.query_params.get('is_favorited')
             if is_favorited is not None:
-                is_favorited = is_favorited in ['1', 'true', 'True']
-                queryset = queryset.annotate(
-                    favorited=Exists(
-                        FavoriteRecipe.objects.filter(
-                            user=user,
-                            recipe=OuterRef('pk')
-                        )
-                    )
-                ).filter(favorited=is_favorited)
+                queryset = queryset.filter(
+                    is_favorited=is_favorited in ['1', 'true', 'True'])
 
             # Фильтрация по is_in_shopping_cart
             is_in_shopping_cart = self.request.query_params.get(
                 'is_in_shopping_cart')
             if is_in_shopping_cart is not None:
-                is_in_shopping_cart = is_in_shopping_cart in [
-                    '1', 'true', 'True']
-                queryset = queryset.annotate(
-                    in_shopping_cart=Exists(
-                        ShoppingCart.objects.filter(
-                            user=user,
-                            recipe=OuterRef('pk')
-                        )
-                    )
-                ).filter(in_shopping_cart=is_in_shopping_cart)
+                queryset = queryset.filter(
+                    is_in_shopping_cart=is_in_shopping_cart in [
+                        '1', 'true', 'True'])
+        else:
+            queryset = queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
 
         # Фильтрация по author
         author_param = self.request.query_params.get('author')
@@ -194,39 +267,106 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def cached_response(self, request, handler, *args, **kwargs):
+        """
+        Отдает готовый JSON из кэша анонимным пользователям,
+        при промахе сохраняет в кэш успешный ответ обработчика.
+        """
+        if not response_cache.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+
+        key = response_cache.response_key(request, kwargs.get('pk'))
+        content = response_cache.get_response(key)
+        cache_status = 'HIT'
+        if content is None:
+            cache_status = 'MISS'
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            content = JSONRenderer().render(response.data)
+            response_cache.set_response(key, content)
+
+        response = HttpResponse(content, content_type='application/json')
+        response['X-Cache'] = cache_status
+        return response
+
+    def fragment_list(self, request):
+        """
+        Список рецептов из кэшированных фрагментов: основной запрос
+        страницы возвращает только id и флаги пользователя, полностью
+        загружаются и сериализуются лишь рецепты, которых нет в кэше.
+        """
+        rows = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()).prefetch_related(
+                None).values('id', 'pub_date', *response_cache.USER_FLAGS)
+        )
+        keys = response_cache.fragment_keys(
+            request, [row['id'] for row in rows])
+        fragments = response_cache.get_fragments(keys)
+
+        missing = [row['id'] for row in rows if row['id'] not in fragments]
+        if missing:
+            recipes = self.get_queryset().filter(id__in=missing)
+            fragments.update(response_cache.set_fragments(
+                keys, self.get_serializer(recipes, many=True).data))
+
+        return self.get_paginated_response([
+            response_cache.overlay(fragments[row['id']], row) for row in rows
+        ])
+
+    def list(self, request, *args, **kwargs):
+        if (request.user.is_authenticated
+                and settings.RECIPE_FRAGMENT_CACHE_TIMEOUT > 0
+                and request.accepted_renderer.format == 'json'):
+            return self.fragment_list(request)
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs)
+
+    def refresh_instance(self, serializer):
+        # Перечитываем рецепт через get_queryset, чтобы ответ
+        # сериализовался с предзагрузкой и аннотациями
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        self.refresh_instance(serializer)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    def perform_update(self, serializer):
+        serializer.save()
+        self.refresh_instance(serializer)
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS,
+            content_negotiation_class=ShoppingListNegotiation)
     def download_shopping_cart(self, request):
         user = request.user
 
-        # Получаем список ингредиентов с сортировкой по названиям
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in=user.shoppingcarts.values('recipe')
-        ).values(
+        # Итоги по продуктам хранятся в ShoppingCartTotal
+        # и читаются одним проходом по индексу пользователя
+        ingredients = user.shopping_cart_totals.values(
+            'amount',
             name=F('ingredient__name'),
             measurement_unit=F('ingredient__measurement_unit')
-        ).annotate(
-            amount=Sum('amount')
-        ).order_by('name')  # Добавлена сортировка по названию ингредиента
+        ).order_by('name')
 
         recipes = user.shoppingcarts.values_list('recipe__name', flat=True)
 
-        # Используем функцию рендера для создания содержимого
-        content = render_shopping_list(ingredients, recipes)
-
-        # Создаем поток BytesIO для передачи файла
-        buffer = BytesIO()
-        buffer.write(content.encode('utf-8'))
-        buffer.seek(0)
-
-        # Возвращаем файл как ответ
-        return FileResponse(
-            buffer,
-            as_attachment=True,
-            filename=f'Shopping_cart_{datetime.now().strftime("%Y%m%d%H%M%S")}.txt'
+        # Формат выбран DRF по ?format= (txt, csv, pdf); документ
+        # отдается по частям, строки читаются из базы итератором
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients.iterator(), recipes.iterator()),
+            content_type=(f'{renderer.media_type}; charset={renderer.charset}'
+                          if renderer.charset else renderer.media_type)
         )
+        filename = (f'Shopping_cart_{datetime.now().strftime("%Y%m%d%H%M%S")}'
+                    f'.{renderer.format}')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
@@ -300,6 +440,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class CacheStatsView(APIView):
+    """Счетчики попаданий в кэш ответов для мониторинга."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(response_cache.get_stats())
+
+
 def recipe_redirect_view(request, recipe_id):
     # Проверяем, существует ли рецепт с указанным recipe_id
     recipe = get_object_or_404(Recipe, id=recipe_id)
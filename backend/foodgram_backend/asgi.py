@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
+# Представления чтения выполняются в пуле потоков, не блокируя цикл событий
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
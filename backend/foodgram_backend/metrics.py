@@ -0,0 +1,142 @@
+"""
+Метрики запросов в памяти процесса и их выдача в текстовом формате
+Prometheus.
+
+Каждый процесс (воркер gunicorn) хранит свои значения, поэтому
+Prometheus должен опрашивать воркеры по отдельности или довольствоваться
+выборкой одного из них при каждом опросе.
+"""
+import hmac
+import threading
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2)
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # {метки: [счетчики корзин..., сумма, число наблюдений]}
+        self.values = {}
+
+    def observe(self, labels, value):
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[index] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, row in sorted(self.values.items()):
+            prefix = format_labels(labels)
+            for bound, count in zip(self.buckets, row):
+                yield f'{self.name}_bucket{{{prefix},le="{bound}"}} {count}'
+            yield f'{self.name}_bucket{{{prefix},le="+Inf"}} {row[-1]}'
+            yield f'{self.name}_sum{{{prefix}}} {row[-2]}'
+            yield f'{self.name}_count{{{prefix}}} {row[-1]}'
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+
+    def inc(self, labels):
+        self.values[labels] = self.values.get(labels, 0) + 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{{{format_labels(labels)}}} {value}'
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter(
+            'foodgram_requests_total', 'Число запросов')
+        self.duration = Histogram(
+            'foodgram_request_duration_seconds',
+            'Время обработки запроса', DURATION_BUCKETS)
+        self.db_duration = Histogram(
+            'foodgram_db_duration_seconds',
+            'Время SQL-запросов за запрос', DURATION_BUCKETS)
+        self.queries = Histogram(
+            'foodgram_db_queries',
+            'Число SQL-запросов за запрос', QUERIES_BUCKETS)
+        self.render_duration = Histogram(
+            'foodgram_render_duration_seconds',
+            'Время сериализации ответа рендерером', DURATION_BUCKETS)
+        self.response_size = Histogram(
+            'foodgram_response_size_bytes',
+            'Размер тела ответа', SIZE_BUCKETS)
+
+    def observe(self, view, status, duration, db_duration, queries,
+                render_duration, size):
+        labels = (('view', view),)
+        with self.lock:
+            self.requests.inc(labels + (('status', status),))
+            self.duration.observe(labels, duration)
+            self.db_duration.observe(labels, db_duration)
+            self.queries.observe(labels, queries)
+            if render_duration is not None:
+                self.render_duration.observe(labels, render_duration)
+            if size is not None:
+                self.response_size.observe(labels, size)
+
+    def render(self):
+        with self.lock:
+            lines = [
+                line
+                for metric in (
+                    self.requests, self.duration, self.db_duration,
+                    self.queries, self.render_duration, self.response_size
+                )
+                for line in metric.render()
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    """
+    Метрики для Prometheus с заголовком Authorization: Bearer
+    METRICS_TOKEN. Порт приложения может быть доступен в обход nginx,
+    поэтому без токена в настройках адрес выключен.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(),
+        f'Bearer {token}'.encode()
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
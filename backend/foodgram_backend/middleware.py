@@ -0,0 +1,163 @@
+import asyncio
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import registry
+
+# Счетчик SQL текущего запроса. Переменная контекста видна и в потоках,
+# где выполняются синхронные представления в режиме ASGI
+current_timer = ContextVar('current_timer', default=None)
+
+
+class QueryTimer:
+    """Обертка выполнения SQL, считающая запросы и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def time_query(execute, sql, params, many, context):
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    """Подключает к соединению обертку, считающую запросы current_timer."""
+    # В начало списка: execute_wrapper() снимает обертки с конца
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+connection_created.connect(
+    install_query_timer, dispatch_uid='request_metrics_query_timer')
+
+
+def render_response(request, response):
+    """
+    Рендерит ответ DRF сразу, а не после выхода из обработчика,
+    и записывает время рендеринга для метрик.
+    """
+    if callable(getattr(response, 'render', None)) and not getattr(
+            response, 'is_rendered', True):
+        start = time.perf_counter()
+        response.render()
+        request._render_duration = time.perf_counter() - start
+    return response
+
+
+def get_view_name(request):
+    """Имя обработчика, например RecipeViewSet.list."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    view_class = getattr(func, 'cls', None) or getattr(
+        func, 'view_class', None)
+    if view_class is None:
+        return func.__name__
+    method = request.method.lower()
+    # У вьюсетов DRF метод HTTP сопоставлен с действием
+    action = (getattr(func, 'actions', None) or {}).get(method, method)
+    return f'{view_class.__name__}.{action}'
+
+
+class RequestMetricsMiddleware:
+    """
+    Собирает для каждого запроса имя обработчика, число и время
+    SQL-запросов, время рендеринга ответа и его размер. Значения
+    попадают в метрики Prometheus и в заголовок Server-Timing.
+
+    Запросы, которые выполняются при чтении потокового ответа
+    (выгрузка списка покупок), в метриках не учитываются.
+
+    Работает и в режиме ASGI, не занимая поток на время запроса:
+    запросы к базе из любых потоков считаются через current_timer.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Так Django узнает, что middleware асинхронный
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        # Соединения, открытые до загрузки middleware
+        for connection in connections.all():
+            install_query_timer(connection=connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        request._render_duration = None
+        start = time.perf_counter()
+        token = current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        request._render_duration = None
+        start = time.perf_counter()
+        token = current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, timer, start)
+
+    def finish(self, request, response, timer, start):
+        duration = time.perf_counter() - start
+
+        size = None if response.streaming else len(response.content)
+        registry.observe(
+            view=get_view_name(request),
+            status=response.status_code,
+            duration=duration,
+            db_duration=timer.duration,
+            queries=timer.count,
+            render_duration=request._render_duration,
+            size=size,
+        )
+        if settings.SERVER_TIMING_HEADER:
+            render = request._render_duration or 0
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={timer.duration * 1000:.1f};'
+                f'desc="SQL: {timer.count}"',
+                f'render;dur={render * 1000:.1f}',
+                f'app;dur='
+                f'{(duration - timer.duration - render) * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f}',
+            ))
+        return response
+
+    def process_template_response(self, request, response):
+        if response.is_rendered:
+            # Ответ уже отрендерен в пуле потоков (render_response)
+            return response
+        # Ответы DRF рендерятся после выхода из обработчика
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._render_duration = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
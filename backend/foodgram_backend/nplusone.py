@@ -0,0 +1,94 @@
+"""
+Обнаружение запросов N+1 в тестах.
+
+Во время запроса к API выполненные SQL-запросы группируются по
+нормализованному тексту (без значений параметров и длины списков IN)
+и месту вызова — ближайшему кадру стека из кода проекта. Если один и
+тот же запрос из одного места выполнился больше порога раз, это
+почти всегда запрос в цикле по объектам страницы.
+"""
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+# Повторов одного запроса из одного места больше этого числа — N+1
+DEFAULT_THRESHOLD = 2
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SPACES = re.compile(r'\s+')
+# Служебные команды транзакций повторяются законно
+IGNORED = re.compile(r'^(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)')
+
+# Кадры пакета проекта (middleware, этот модуль) местом вызова не считаются
+PROJECT_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+
+def normalize(sql):
+    sql = IN_LIST.sub('IN (...)', sql)
+    sql = LITERALS.sub('?', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def call_site():
+    """Ближайший к запросу кадр стека из кода приложений проекта."""
+    base = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if (filename.startswith(base)
+                and not filename.startswith(PROJECT_PACKAGE)
+                and 'site-packages' not in filename):
+            return f'{os.path.relpath(filename, base)}:{frame.lineno}'
+    return 'неизвестно'
+
+
+class QueryCollector:
+    """Обертка выполнения SQL, считающая повторы запросов."""
+
+    def __init__(self):
+        self.queries = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not IGNORED.match(sql):
+            self.queries[normalize(sql), call_site()] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold=DEFAULT_THRESHOLD):
+        """Запросы, повторенные больше threshold раз из одного места."""
+        return [
+            (count, sql, site)
+            for (sql, site), count in self.queries.most_common()
+            if count > threshold
+        ]
+
+
+@contextmanager
+def collect_queries():
+    collector = QueryCollector()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+        yield collector
+
+
+class NPlusOneTestMixin:
+    """Примесь к TestCase с проверкой assertNoNPlusOne."""
+    n_plus_one_threshold = DEFAULT_THRESHOLD
+
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=None):
+        if threshold is None:
+            threshold = self.n_plus_one_threshold
+        with collect_queries() as collector:
+            yield collector
+        repeated = collector.repeated(threshold)
+        if repeated:
+            self.fail('Повторяющиеся запросы (N+1):\n' + '\n'.join(
+                f'{count} раз, {site}: {sql}'
+                for count, sql, site in repeated
+            ))
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы учитывать время всех остальных обработчиков
+    'foodgram_backend.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -105,6 +107,34 @@ DATABASES = {
 }
 
 
+# Кэш: по умолчанию в памяти процесса, в продакшене задается общий
+# для воркеров бэкенд (infra/docker-compose.yml: memcached и
+# django.core.cache.backends.memcached.PyMemcacheCache)
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# У каждого воркера gunicorn свой LocMemCache: сброс версий в одном
+# воркере не виден другим, и они отдавали бы устаревшие ответы. Поэтому
+# без общего бэкенда кэш ответов и фрагментов по умолчанию отключен
+SHARED_CACHE = CACHE_BACKEND not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Время жизни кэша ответов для анонимных пользователей (0 — отключен)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv(
+    'RESPONSE_CACHE_TIMEOUT', 300 if SHARED_CACHE else 0))
+# Время жизни фрагментов рецептов для авторизованных (0 — отключен),
+# по той же причине без общего бэкенда по умолчанию отключен
+RECIPE_FRAGMENT_CACHE_TIMEOUT = int(os.getenv(
+    'RECIPE_FRAGMENT_CACHE_TIMEOUT', 3600 if SHARED_CACHE else 0))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -145,6 +175,8 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Имена файлов по содержимому, одинаковые картинки хранятся один раз
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
 
 
 # Default primary key field type
@@ -167,6 +199,38 @@ REST_FRAMEWORK = {
 
 }
 
+# Поиск продуктов для автодополнения: запрос к базе по триграммному
+# индексу и лимит результатов. INGREDIENT_SEARCH_INDEX включает поиск
+# по префиксу в памяти процесса — весь справочник в каждом воркере
+INGREDIENT_SEARCH_INDEX = os.getenv(
+    'INGREDIENT_SEARCH_INDEX', 'False').lower() in ('true', '1')
+INGREDIENT_SEARCH_INDEX_TTL = int(os.getenv('INGREDIENT_SEARCH_INDEX_TTL', 300))
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 20))
+
+# Заголовок Server-Timing с временем SQL и рендеринга в ответах API.
+# Раскрывает число запросов к базе, поэтому по умолчанию только в DEBUG
+SERVER_TIMING_HEADER = os.getenv(
+    'SERVER_TIMING_HEADER', str(DEBUG)).lower() in ('true', '1')
+# Токен для /metrics/; пока он не задан, адрес отвечает 404
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Загрузка картинок: предельный размер файла и сторона в пикселях
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', 6000))
+# Потоки для создания уменьшенных копий (0 — сразу при сохранении)
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
+
+# Асинхронные представления чтения (включаются в asgi.py) и размер пула
+# потоков для них — он же предел соединений с базой на процесс
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() in ('true', '1')
+ASYNC_VIEW_THREADS = int(os.getenv('ASYNC_VIEW_THREADS', 8))
+
+# TrueType-шрифт с кириллицей для списка покупок в формате PDF
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 DJOSER = {
     'SERIALIZERS': {
         'user': 'foodgram_api.serializers.CustomUserSerializer',
@@ -3,9 +3,12 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('foodgram_api.urls'))
+    path('api/', include('foodgram_api.urls')),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,13 @@
+"""
+Воркер gunicorn для режима ASGI:
+
+    SERVER_MODE=asgi gunicorn --config gunicorn.conf.py
+
+Django 3.2 не поддерживает события lifespan протокола ASGI, поэтому
+они отключены, чтобы uvicorn не писал об этом в лог при каждом запуске.
+"""
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    CONFIG_KWARGS = {**BaseUvicornWorker.CONFIG_KWARGS, 'lifespan': 'off'}
@@ -0,0 +1,120 @@
+"""
+Настройки gunicorn для продакшена. Файл читается gunicorn из рабочего
+каталога (/app в образе); значения переопределяются переменными
+окружения GUNICORN_*.
+
+Число воркеров считается по ядрам, доступным контейнеру (с учетом
+квоты cgroup, то есть docker run --cpus), а не по ядрам хоста.
+Приложение загружается в мастер-процессе до fork (preload_app), и
+воркеры делят память импортированных Django и DRF через копирование
+при записи. Соединения с базой и кэшем, открытые при загрузке,
+закрываются до fork, чтобы воркеры не унаследовали чужие сокеты.
+"""
+import math
+import os
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.lower() in ('true', '1')
+
+
+def cpu_count(cgroup_root='/sys/fs/cgroup'):
+    """Число ядер, доступных процессу: привязка к ядрам и квота cgroup."""
+    if hasattr(os, 'sched_getaffinity'):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count() or 1
+    for quota_path, period_path in (
+        # cgroup v2: в одном файле "квота период" или "max период"
+        ('cpu.max', None),
+        ('cpu/cpu.cfs_quota_us', 'cpu/cpu.cfs_period_us'),
+    ):
+        try:
+            with open(os.path.join(cgroup_root, quota_path)) as file:
+                values = file.read().split()
+            if period_path is not None:
+                with open(os.path.join(cgroup_root, period_path)) as file:
+                    values.append(file.read().strip())
+            quota, period = int(values[0]), int(values[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if quota > 0:
+            count = min(count, math.ceil(quota / period))
+        break
+    return max(1, count)
+
+
+CORES = cpu_count()
+# wsgi — воркеры gthread, asgi — воркеры uvicorn (foodgram_api/async_views.py)
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'foodgram_backend.asgi:application'
+    worker_class = 'foodgram_backend.workers.UvicornWorker'
+    # Воркер с циклом событий сам ждет медленных клиентов: по одному на ядро
+    workers = env_int('GUNICORN_WORKERS', CORES)
+else:
+    wsgi_app = 'foodgram_backend.wsgi:application'
+    # Классическая формула 2 * ядра + 1 с верхней границей: каждый
+    # воркер держит свои соединения с базой
+    workers = env_int('GUNICORN_WORKERS', min(
+        2 * CORES + 1, env_int('GUNICORN_MAX_WORKERS', 12)))
+    # Потоки воркера gthread обслуживают запросы, пока другие ждут базу;
+    # соединения keep-alive ждут в общем цикле воркера, а не в потоке
+    threads = env_int('GUNICORN_THREADS', 2)
+    worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Запрос дольше timeout секунд считается зависшим, воркер перезапускается
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+# За nginx соединения держатся недолго
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+
+# Воркер перезапускается после max_requests запросов, чтобы память не
+# росла бесконечно; разброс, чтобы воркеры не перезапускались разом
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+preload_app = env_bool('GUNICORN_PRELOAD', True)
+
+# Сердцебиение воркеров в памяти: в контейнере /tmp может быть
+# на медленном overlayfs, и запись в него задерживает воркеры
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def close_connections():
+    from django.core.cache import caches
+    from django.db import connections
+
+    connections.close_all()
+    for cache in caches.all():
+        cache.close()
+
+
+def when_ready(server):
+    server.log.info(
+        'Режим %s: воркеров %s, потоков %s, ядер %s',
+        SERVER_MODE, server.cfg.workers, server.cfg.threads, CORES)
+
+
+def pre_fork(server, worker):
+    # Соединения, открытые мастером при загрузке приложения
+    # (preload_app), иначе достались бы воркерам: закрытие общего
+    # сокета в одном процессе оборвало бы его для остальных
+    if server.cfg.preload_app:
+        close_connections()
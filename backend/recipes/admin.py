@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Prefetch, Q
 from .models import (Recipe, Ingredient, FavoriteRecipe,
                      ShoppingCart, Subscribe, RecipeIngredient)
 from django.contrib.auth import get_user_model
@@ -18,16 +19,57 @@ class IngredientInline(admin.StackedInline):
     model = RecipeIngredient
     extra = 0
     fields = ('ingredient', 'amount')
+    # Список продуктов подгружается поиском, а не целиком в каждый select
+    autocomplete_fields = ('ingredient',)
+
+
+class AuthorFilter(admin.SimpleListFilter):
+    """
+    Фильтр по автору с полем ввода и подсказками из автокомплита
+    админки вместо списка всех пользователей в боковой панели.
+    """
+    title = 'Автор'
+    parameter_name = 'author'
+    template = 'admin/recipes/author_filter.html'
+
+    def lookups(self, request, model_admin):
+        # Варианты не выводятся: значение вводится в поле фильтра
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            'reset_query_string': changelist.get_query_string(
+                remove=[self.parameter_name]),
+            # Остальные фильтры сохраняются при отправке формы
+            'hidden_params': [
+                (name, value)
+                for name, value in changelist.get_filters_params().items()
+                if name != self.parameter_name
+            ],
+        }
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            return queryset.filter(
+                Q(author__email=value) | Q(author__username=value))
+        return queryset
 
 
 class FavoriteRecipeInline(admin.TabularInline):
     model = FavoriteRecipe
     extra = 0
+    autocomplete_fields = ('user',)
 
 
 class ShoppingCartInline(admin.TabularInline):
     model = ShoppingCart
     extra = 0
+    autocomplete_fields = ('user',)
 
 
 @admin.register(Recipe)
@@ -45,13 +87,25 @@ class RecipeAdmin(admin.ModelAdmin):
     # Поля, по которым можно искать
     search_fields = ('name', 'author__username')
     # Поля для фильтрации
-    list_filter = ('author', 'pub_date')
+    list_filter = (AuthorFilter, 'pub_date')
+    autocomplete_fields = ('author',)
     inlines = (IngredientInline, FavoriteRecipeInline, ShoppingCartInline)
 
+    def get_queryset(self, request):
+        # Автор и продукты загружаются для всей страницы списка сразу
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
     # Метод для получения общего числа добавлений рецепта в избранное
     @admin.display(description='В избранном')
     def get_favorites_count(self, recipe):
-        return recipe.favoriterecipes.count()
+        return recipe.favorites_count
 
     # Метод для отображения продуктов в HTML-формате
     @admin.display(description='Продукты')
@@ -82,6 +136,8 @@ class IngredientAdmin(admin.ModelAdmin):
 @admin.register(FavoriteRecipe, ShoppingCart)
 class FavoriteShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
 
 
@@ -107,26 +163,31 @@ class UserAdmin(BaseUserAdmin):
         return f'{user.first_name} {user.last_name}'.strip()
 
     @admin.display(description='Аватар')
-    @mark_safe
     def avatar(self, user):
-        if user.avatar_url:
+        if user.avatar:
             return format_html(
-                f'<img src="{user.avatar_url}" '
-                f'style="width: 50px; height: 50px; border-radius: 50%;" />'
+                '<img src="{}" '
+                'style="width: 50px; height: 50px; border-radius: 50%;" />',
+                user.avatar.url
             )
         return "No Avatar"
 
     @admin.display(description='Число рецептов')
     def recipe_count(self, user):
-        return user.recipes.count()
+        return user.recipes_count
 
     @admin.display(description='Число подписок')
     def subscription_count(self, user):
-        return user.users.count()
+        return user.subscriptions_count
 
     @admin.display(description='Число подписчиков')
     def follower_count(self, user):
-        return user.authors.count()
+        return user.followers_count
 
 
-admin.site.register(Subscribe)
+@admin.register(Subscribe)
+class SubscribeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
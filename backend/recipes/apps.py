@@ -5,3 +5,9 @@ class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = 'Рецепты'
+
+    def ready(self):
+        from .signals import connect_signals
+
+        # Счетчики избранного, рецептов и подписок
+        connect_signals()
@@ -0,0 +1,230 @@
+"""
+Уменьшенные копии (рендиции) картинок рецептов и аватаров.
+
+После сохранения модели с новой картинкой копии создаются в пуле
+потоков после фиксации транзакции, чтобы не задерживать ответ на
+запрос. При IMAGE_RENDITION_WORKERS = 0 копии создаются сразу
+(удобно в тестах и командах). Пути к копиям хранятся в JSON-поле
+модели вместе с именем исходного файла (ключ source) и версией
+набора копий: если они не совпадают с текущими, копии устарели.
+"""
+import io
+import logging
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import OperationalError, connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Имя копии и ее ширина в пикселях
+RENDITIONS = {
+    'thumbnail': 240,
+    'card': 600,
+    'full': 1200,
+}
+# Форматы копий и параметры сохранения Pillow
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+# Меняется при изменении набора копий, чтобы старые считались устаревшими
+RENDITIONS_VERSION = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Пул создается лазиво, уже в процессе воркера после fork
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_RENDITION_WORKERS,
+                thread_name_prefix='renditions'
+            )
+        return _executor
+
+
+def flatten(image):
+    """RGB-копия картинки; прозрачные области становятся белыми."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def is_current(name, renditions):
+    """Копии созданы для картинки name текущей версией кода."""
+    return (
+        bool(name)
+        and renditions.get('source') == name
+        and renditions.get('version') == RENDITIONS_VERSION
+    )
+
+
+def make_renditions(file):
+    """
+    Создает копии картинки file (FieldFile) заданной ширины
+    в каждом формате и возвращает их пути. Картинка не
+    увеличивается: копии шире исходной не создаются.
+    """
+    storage = file.storage
+    # Копии сохраняются в каталог upload_to поля, а не рядом с файлом:
+    # у хранилища по содержимому он вложен в каталоги по хешу
+    stem = posixpath.join(
+        file.field.upload_to,
+        posixpath.splitext(posixpath.basename(file.name))[0])
+    renditions = {'source': file.name, 'version': RENDITIONS_VERSION}
+    with storage.open(file.name) as source, Image.open(source) as image:
+        # Для JPEG декодируем сразу в уменьшенном масштабе
+        largest = max(RENDITIONS.values())
+        image.draft('RGB', (largest, largest))
+        image = flatten(image)
+        for name, width in sorted(RENDITIONS.items(), key=lambda x: x[1]):
+            width = min(width, image.width)
+            height = max(1, round(image.height * width / image.width))
+            copy = image.resize((width, height), Image.LANCZOS)
+            rendition = {'width': width}
+            for extension, (file_format, params) in FORMATS.items():
+                buffer = io.BytesIO()
+                copy.save(buffer, file_format, **params)
+                rendition[extension] = storage.save(
+                    f'{stem}_{width}.{extension}',
+                    ContentFile(buffer.getvalue()))
+            renditions[name] = rendition
+            if width == image.width:
+                break
+    return renditions
+
+
+def get_srcset(file, renditions):
+    """
+    Пути копий для атрибута srcset по форматам:
+    {'webp': [(путь, ширина), ...], 'jpeg': [...]}; None, если копий нет.
+    """
+    if not is_current(file.name, renditions):
+        return None
+    return {
+        extension: [
+            (renditions[name][extension], renditions[name]['width'])
+            for name in RENDITIONS if name in renditions
+        ]
+        for extension in FORMATS
+    }
+
+
+def rendition_paths(renditions):
+    """Пути файлов копий (без исходной картинки)."""
+    for name, rendition in renditions.items():
+        if name in ('source', 'version'):
+            continue
+        if isinstance(rendition, dict):
+            yield from (
+                path for key, path in rendition.items() if key != 'width')
+        else:
+            # Копии первой версии хранились строками
+            yield rendition
+
+
+def release_files(storage, names):
+    """
+    Удаляет файлы names. Хранилище по содержимому (recipes/storage.py)
+    вместо этого одним запросом уменьшает число ссылок на них.
+    """
+    names = [name for name in names if name]
+    if hasattr(storage, 'release'):
+        storage.release(names)
+        return
+    for name in names:
+        storage.delete(name)
+
+
+def delete_renditions(storage, renditions):
+    release_files(storage, rendition_paths(renditions))
+
+
+def store_renditions(model, pk, image_field, renditions_field, file,
+                     renditions):
+    """Сохраняет пути копий, если картинка объекта все еще file."""
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(
+            pk=pk, **{image_field: file.name}).first()
+        if instance is None:
+            # Картинку успели заменить или объект удален
+            delete_renditions(file.storage, renditions)
+            return
+        old = getattr(instance, renditions_field)
+        setattr(instance, renditions_field, renditions)
+        # save() отправляет post_save, по нему сбрасывается кэш ответов
+        instance.save(update_fields=[renditions_field])
+    delete_renditions(file.storage, old)
+
+
+def update_renditions(model, pk, image_field, renditions_field, attempts=1):
+    """
+    Создает копии текущей картинки объекта и сохраняет их пути.
+    При блокировке базы (например, SQLite при параллельной записи)
+    сохранение повторяется до attempts раз.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    file = getattr(instance, image_field)
+    if not file:
+        return
+    renditions = make_renditions(file)
+    for attempt in range(attempts):
+        try:
+            return store_renditions(
+                model, pk, image_field, renditions_field, file, renditions)
+        except OperationalError:
+            if attempt + 1 == attempts:
+                delete_renditions(file.storage, renditions)
+                raise
+            time.sleep(0.1 * 2 ** attempt)
+
+
+def run_task(*args):
+    try:
+        update_renditions(*args)
+    except Exception:
+        logger.exception('Не удалось создать копии картинки %s', args)
+    finally:
+        # Соединения потока пула не закрываются Django сами
+        connections.close_all()
+
+
+def schedule_renditions(instance, image_field, renditions_field):
+    """
+    Ставит в очередь создание копий, если они устарели,
+    и удаляет копии картинки, которую убрали.
+    """
+    file = getattr(instance, image_field)
+    renditions = getattr(instance, renditions_field)
+    if not file:
+        if renditions:
+            type(instance).objects.filter(pk=instance.pk).update(
+                **{renditions_field: {}})
+            setattr(instance, renditions_field, {})
+            delete_renditions(file.storage, renditions)
+        return
+    if is_current(file.name, renditions):
+        return
+
+    args = (type(instance), instance.pk, image_field, renditions_field)
+    if settings.IMAGE_RENDITION_WORKERS > 0:
+        transaction.on_commit(lambda: get_executor().submit(run_task, *args))
+    else:
+        update_renditions(*args)
+        setattr(instance, renditions_field, getattr(
+            type(instance).objects.get(pk=instance.pk), renditions_field))
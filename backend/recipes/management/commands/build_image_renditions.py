@@ -0,0 +1,88 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from recipes.images import is_current, update_renditions
+from recipes.signals import IMAGE_FIELDS
+
+# Сколько первых ошибок выводить подробно
+MAX_REPORTED_ERRORS = 20
+# Попытки сохранить пути копий при блокировке базы другим процессом
+SAVE_ATTEMPTS = 5
+
+
+def build(model_label, pk, image_field, renditions_field):
+    """Задача для процесса пула: создает копии картинки одного объекта."""
+    update_renditions(
+        apps.get_model(model_label), pk, image_field, renditions_field,
+        attempts=SAVE_ATTEMPTS)
+    return pk
+
+
+class Command(BaseCommand):
+    help = ('Создание уменьшенных копий картинок рецептов и аватаров, '
+            'для которых их еще нет, параллельно на всех ядрах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Число процессов (по умолчанию — число ядер, '
+                 '0 — в текущем процессе)')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии всех картинок')
+
+    def handle(self, *args, **options):
+        tasks = [
+            (model._meta.label, pk, image_field, renditions_field)
+            for model, (image_field, renditions_field) in IMAGE_FIELDS.items()
+            for pk, name, renditions in model.objects.exclude(
+                **{image_field: ''}
+            ).values_list('pk', image_field, renditions_field).iterator()
+            if options['force'] or not is_current(name, renditions)
+        ]
+        self.stdout.write(f'Картинок для обработки: {len(tasks)}')
+        if not tasks:
+            return
+
+        failed = done = 0
+        start = time.perf_counter()
+        for task, error in self.run_tasks(tasks, options['workers']):
+            if error is not None:
+                failed += 1
+                if failed <= MAX_REPORTED_ERRORS:
+                    model_label, pk, *_ = task
+                    self.stderr.write(f'{model_label} {pk}: {error}')
+            done += 1
+            if done % 100 == 0 or done == len(tasks):
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'Обработано {done} из {len(tasks)}, '
+                    f'{done / elapsed:.1f} картинок/с')
+
+        if failed:
+            raise CommandError(f'Не удалось обработать картинок: {failed}')
+        self.stdout.write(self.style.SUCCESS('Копии картинок созданы.'))
+
+    @staticmethod
+    def run_tasks(tasks, workers):
+        """Пары (задача, ошибка или None) по мере выполнения задач."""
+        if workers < 1:
+            for task in tasks:
+                try:
+                    build(*task)
+                except Exception as e:
+                    yield task, e
+                else:
+                    yield task, None
+            return
+        # Дочерние процессы не должны наследовать открытые соединения
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(build, *task): task for task in tasks}
+            for future in as_completed(futures):
+                yield futures[future], future.exception()
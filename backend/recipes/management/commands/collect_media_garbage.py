@@ -0,0 +1,144 @@
+import os
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.images import rendition_paths
+from recipes.models import StoredFile
+from recipes.signals import IMAGE_FIELDS
+
+
+def referenced_files():
+    """Число ссылок из базы на каждый файл: картинки и их копии."""
+    references = Counter()
+    for model, (image_field, renditions_field) in IMAGE_FIELDS.items():
+        for name, renditions in model.objects.values_list(
+            image_field, renditions_field
+        ).iterator():
+            if name:
+                references[name] += 1
+            references.update(rendition_paths(renditions))
+    return references
+
+
+def media_files(storage, directories):
+    """Файлы в каталогах directories: имя, размер и время изменения."""
+    for directory in directories:
+        root = storage.path(directory)
+        for path, _, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(path, filename)
+                try:
+                    stat = os.stat(full_path)
+                except FileNotFoundError:
+                    continue
+                name = os.path.relpath(full_path, storage.location)
+                yield name.replace(os.sep, '/'), stat.st_size, stat.st_mtime
+
+
+class Command(BaseCommand):
+    help = ('Удаление картинок, на которые не ссылаются рецепты и '
+            'пользователи, и пересчет ссылок на файлы хранилища. '
+            'Файлы, измененные за последние --grace секунд, не трогаются: '
+            'их могут сохранять текущие запросы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=3600,
+            help='Возраст файла в секундах, после которого он может '
+                 'быть удален (по умолчанию 3600)')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        dry_run = options['dry_run']
+        deadline = time.time() - options['grace']
+        directories = sorted({
+            model._meta.get_field(image_field).upload_to
+            for model, (image_field, _) in IMAGE_FIELDS.items()
+        })
+
+        # Число ссылок до подсчета: строки, которые запросы изменят
+        # во время подсчета, update_refs не трогает
+        snapshot = dict(StoredFile.objects.values_list('name', 'refs'))
+        references = referenced_files()
+        present = set()
+        removed = freed = recent = 0
+        for name, size, mtime in media_files(storage, directories):
+            if mtime > deadline:
+                recent += 1
+                continue
+            # Сюда же попадают брошенные временные файлы TEMP_PREFIX
+            if name in references:
+                present.add(name)
+                continue
+            removed += 1
+            freed += size
+            if not dry_run:
+                os.remove(storage.path(name))
+        missing = sum(
+            1 for name in references
+            if name not in present and not storage.exists(name))
+
+        skipped = 0
+        if not dry_run:
+            skipped = self.update_refs(storage, references, present, snapshot)
+
+        self.stdout.write(
+            f'Файлов без ссылок: {removed} ({freed / 2 ** 20:.1f} МБ), '
+            f'свежих файлов пропущено: {recent}, '
+            f'ссылок на отсутствующие файлы: {missing}, '
+            f'счетчиков изменено во время подсчета: {skipped}')
+        self.stdout.write(self.style.SUCCESS(
+            'Ничего не удалено (--dry-run).' if dry_run
+            else 'Хранилище очищено.'))
+
+    @staticmethod
+    def update_refs(storage, references, present, snapshot):
+        """
+        Число ссылок в StoredFile по фактическим ссылкам из базы.
+        Файлы, сохраненные до перехода на хранилище по содержимому,
+        получают строки и с этого момента удаляются при освобождении.
+
+        Подсчет ссылок идет без блокировок, поэтому строки, число
+        ссылок в которых изменилось по сравнению со snapshot, остаются
+        как есть: сохранение и удаление файлов учли их точнее подсчета.
+        Возвращает число таких строк.
+        """
+        with transaction.atomic():
+            stored = {
+                item.name: item
+                for item in StoredFile.objects.select_for_update()
+            }
+            unchanged = {
+                name for name, item in stored.items()
+                if snapshot.get(name) == item.refs
+            }
+            changed = []
+            for name in present & unchanged:
+                item = stored[name]
+                if item.refs != references[name]:
+                    item.refs = references[name]
+                    changed.append(item)
+            StoredFile.objects.bulk_update(changed, ['refs'], batch_size=500)
+            # Строки, удаленные во время подсчета, не восстанавливаются
+            StoredFile.objects.bulk_create(
+                [
+                    StoredFile(name=name, refs=references[name])
+                    for name in present - stored.keys() - snapshot.keys()
+                ],
+                batch_size=500,
+                ignore_conflicts=True
+            )
+            # Строки удаленных файлов; у свежих файлов строки остаются
+            StoredFile.objects.filter(pk__in=[
+                stored[name].pk for name in unchanged
+                if name not in present and not storage.exists(name)
+            ]).delete()
+        return len(stored.keys() - unchanged) + len(
+            snapshot.keys() - stored.keys())
@@ -1,39 +1,138 @@
+import csv
 import json
 import os
+import time
+from itertools import islice
+
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
 
+# Размер блока чтения JSON-файла
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_json(file):
+    """
+    Потоково читает JSON-массив объектов, не загружая файл целиком:
+    объекты разбираются по одному по мере чтения блоков.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            # Пропускаем пробелы, запятые и открывающую скобку массива
+            while position < len(buffer) and buffer[position] in ' \t\r\n,[':
+                if buffer[position] == '[':
+                    started = True
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            if position >= len(buffer):
+                break
+            if not started:
+                raise ValueError('Ожидается JSON-массив объектов.')
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                # Объект прочитан не полностью — дочитываем файл
+                break
+            position = end
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            raise ValueError('Неожиданный конец JSON-файла.')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+READERS = {'json': read_json, 'csv': read_csv}
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из JSON-файла'
+    help = 'Загрузка ингредиентов из JSON- или CSV-файла'
 
-    def handle(self, *args, **kwargs):
-        file_name = 'ingredients.json'  # Указываем имя файла
-        try:
-            # Формирование относительного пути
-            file_path = os.path.join(settings.BASE_DIR, 'data', file_name)
-            with open(file_path, encoding='utf-8') as file:
-                data = json.load(file)
-
-            # Используем list comprehension для создания списка ингредиентов
-            ingredients_to_create = [
-                Ingredient(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit']
-                )
-                for item in data
-            ]
-
-            # Массовое создание новых ингредиентов
-            Ingredient.objects.bulk_create(
-                ingredients_to_create,
-                ignore_conflicts=True
-            )
-            self.stdout.write(self.style.SUCCESS('Данные успешно загружены!'))
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(
+                settings.BASE_DIR, 'data', 'ingredients.json'),
+            help='Путь к файлу (по умолчанию data/ingredients.json)')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла (по умолчанию определяется по расширению)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла "{path}".')
 
-        except Exception as e:
+        inserted = skipped = 0
+        start = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = READERS[file_format](file)
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    batch_inserted = self.save_batch(batch)
+                    inserted += batch_inserted
+                    skipped += len(batch) - batch_inserted
+        except (OSError, ValueError, KeyError, TypeError) as e:
             # Добавляем имя файла в сообщение об ошибке
-            self.stdout.write(self.style.ERROR(
-                f'Произошла ошибка при обработке файла "{file_name}": {str(e)}')
+            raise CommandError(
+                f'Произошла ошибка при обработке файла "{path}": {e}. '
+                f'До ошибки добавлено: {inserted}, пропущено: {skipped}.'
             )
+
+        elapsed = time.perf_counter() - start
+        total = inserted + skipped
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные успешно загружены! Добавлено: {inserted}, '
+            f'пропущено (уже есть): {skipped}, всего: {total}, '
+            f'{total / elapsed if elapsed else total:.0f} записей/с.'
+        ))
+
+    @staticmethod
+    @transaction.atomic
+    def save_batch(batch):
+        """
+        Добавляет отсутствующие продукты блока и возвращает их число.
+        Повторный запуск с тем же файлом ничего не меняет.
+        """
+        for name, measurement_unit in batch:
+            if not name or not measurement_unit:
+                raise ValueError(
+                    f'пустое поле в записи {name!r}, {measurement_unit!r}')
+        keys = set(batch)
+        existing = set(
+            Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('name', 'measurement_unit')
+        )
+        new = keys - existing
+        # ignore_conflicts защищает от параллельной загрузки
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in new
+            ],
+            ignore_conflicts=True
+        )
+        return len(new)
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Sum
+
+from recipes.models import ShoppingCart, ShoppingCartTotal
+
+
+def live_totals():
+    """Итоги списков покупок, посчитанные по корзинам и рецептам."""
+    return {
+        (row['user_id'], row['ingredient_id']): row['amount']
+        for row in ShoppingCart.objects.filter(
+            recipe__recipe_ingredients__isnull=False
+        ).values(
+            'user_id',
+            ingredient_id=F('recipe__recipe_ingredients__ingredient_id')
+        ).annotate(
+            amount=Sum('recipe__recipe_ingredients__amount')
+        ).order_by().iterator()
+    }
+
+
+def stored_totals():
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount
+        in ShoppingCartTotal.objects.values_list(
+            'user_id', 'ingredient_id', 'amount').iterator()
+    }
+
+
+class Command(BaseCommand):
+    help = ('Пересчет таблицы итогов списков покупок '
+            'и сверка ее с корзинами пользователей')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить итоги, не пересчитывая их')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                ShoppingCartTotal.objects.all().delete()
+                ShoppingCartTotal.objects.bulk_create(
+                    (
+                        ShoppingCartTotal(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=amount
+                        )
+                        for (user_id, ingredient_id), amount
+                        in live_totals().items()
+                    ),
+                    batch_size=options['batch_size']
+                )
+            self.stdout.write('Итоги списков покупок пересчитаны.')
+
+        expected = live_totals()
+        actual = stored_totals()
+        mismatches = [
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        ]
+        for user_id, ingredient_id in mismatches[:20]:
+            self.stdout.write(
+                f'Пользователь {user_id}, продукт {ingredient_id}: '
+                f'ожидается {expected.get((user_id, ingredient_id))}, '
+                f'в таблице {actual.get((user_id, ingredient_id))}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений в итогах: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги совпадают ({len(actual)} строк).'))
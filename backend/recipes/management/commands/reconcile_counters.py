@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import CustomUser, FavoriteRecipe, Recipe, Subscribe
+
+# Модель со счетчиком, поле счетчика, считаемая модель и ее поле-ссылка
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'subscriptions_count', Subscribe, 'user'),
+    (CustomUser, 'followers_count', Subscribe, 'author'),
+)
+
+
+def actual_count(related_model, field):
+    """Подзапрос с фактическим числом связанных строк."""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = ('Сверка и пересчет денормализованных счетчиков '
+            'избранного, рецептов и подписок')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счетчики, не исправляя их')
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, counter, related_model, field in COUNTERS:
+            with transaction.atomic():
+                mismatched = model.objects.annotate(
+                    actual=actual_count(related_model, field)
+                ).exclude(**{counter: F('actual')})
+                count = mismatched.count()
+                if count and not options['check']:
+                    model.objects.filter(
+                        pk__in=mismatched.values('pk')
+                    ).update(**{counter: actual_count(related_model, field)})
+            total += count
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: расхождений {count}')
+
+        if options['check'] and total:
+            raise CommandError(f'Расхождений в счетчиках: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            'Счетчики исправлены.' if total else 'Счетчики совпадают.'))
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:02
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicates(apps, schema_editor):
+    """
+    Оставляет по одной строке (с меньшим id) на пару (user, recipe),
+    иначе уникальные ограничения ниже не создадутся. Счетчики избранного
+    и итоги списков покупок после этого пересчитывают команды
+    reconcile_counters и rebuild_shopping_cart_totals.
+    """
+    for model_name in ('FavoriteRecipe', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values('user', 'recipe').annotate(
+            keep_id=Min('id'), rows=Count('id')).filter(rows__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(
+                user=duplicate['user'], recipe=duplicate['recipe']
+            ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        # Ограничения уже объявлены в моделях, но отсутствовали в
+        # миграциях; их индексы обслуживают поиск по (user, recipe)
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favoriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favoriterecipe_user_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shoppingcart_user_recipe'),
+        ),
+    ]
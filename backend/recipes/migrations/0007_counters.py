@@ -0,0 +1,60 @@
+# Generated by Django 3.2.16 on 2026-10-17 07:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'FavoriteRecipe', 'recipe'),
+    ('CustomUser', 'recipes_count', 'Recipe', 'author'),
+    ('CustomUser', 'subscriptions_count', 'Subscribe', 'user'),
+    ('CustomUser', 'followers_count', 'Subscribe', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, counter, related_name, field in COUNTERS:
+        related_model = apps.get_model('recipes', related_name)
+        apps.get_model('recipes', model_name).objects.update(**{
+            counter: Coalesce(
+                Subquery(
+                    related_model.objects.filter(
+                        **{field: OuterRef('pk')}
+                    ).order_by().values(field).annotate(
+                        total=Count('pk')
+                    ).values('total')
+                ),
+                0
+            )
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число рецептов'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='subscriptions_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число подписок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,41 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
 
 
 MIN_COOKING_TIME = 1
 MIN_AMOUNT = 1
 
 
-class CustomUser(AbstractUser):
+class CountersModel(models.Model):
+    """
+    Модель с денормализованными счетчиками. Счетчики меняются только
+    выражениями F() в базе (recipes/signals.py), а значения в объекте
+    могут устареть, поэтому полное сохранение их не записывает:
+    поля счетчиков сохраняются, только если указаны в update_fields.
+    """
+    COUNTER_FIELDS = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
+
+
+class CustomUser(CountersModel, AbstractUser):
     email = models.EmailField(
         max_length=254,
         unique=True,
@@ -31,6 +58,31 @@ class CustomUser(AbstractUser):
         blank=True,
         verbose_name='Аватар'
     )
+    # Пути уменьшенных копий аватара (recipes/images.py)
+    avatar_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Копии аватара'
+    )
+    # Счетчики поддерживаются сигналами (recipes/signals.py)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число рецептов'
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число подписок'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число подписчиков'
+    )
+    COUNTER_FIELDS = ('recipes_count', 'subscriptions_count',
+                      'followers_count')
     # Поле, указанное в USERNAME_FIELD считается обязательным.
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
@@ -62,7 +114,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersModel):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -74,6 +126,13 @@ class Recipe(models.Model):
         upload_to='recipes_images',
         verbose_name='Картинка'
     )
+    # Пути уменьшенных копий картинки (recipes/images.py)
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Копии картинки'
+    )
     text = models.TextField(verbose_name='Текстовое описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -87,11 +146,27 @@ class Recipe(models.Model):
         validators=(MinValueValidator(MIN_COOKING_TIME),)
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    # Поддерживается сигналами (recipes/signals.py)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    COUNTER_FIELDS = ('favorites_count',)
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            # Ключ курсорной пагинации ленты рецептов
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+            # Рецепты автора от новых к старым (фильтр ?author=)
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -194,3 +269,108 @@ class Subscribe(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.author.username}'
+
+
+class ShoppingCartTotal(models.Model):
+    """
+    Суммарное количество продукта в списке покупок пользователя.
+    Обновляется сигналами корзины (recipes/signals.py) и при изменении
+    состава рецептов в корзине.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Продукт'
+    )
+    amount = models.IntegerField(verbose_name='Мера')
+
+    class Meta:
+        verbose_name = 'продукт в списке покупок'
+        verbose_name_plural = 'Продукты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.ingredient.name}'
+
+    @staticmethod
+    def recipe_amounts(recipe_id):
+        """Количество каждого продукта в рецепте."""
+        return dict(RecipeIngredient.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+    @classmethod
+    def apply(cls, user_ids, deltas):
+        """
+        Прибавляет к итогам пользователей user_ids изменения
+        количества продуктов deltas ({ingredient_id: delta}).
+        """
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        user_ids = list(user_ids)
+        if not deltas or not user_ids:
+            return
+
+        with transaction.atomic():
+            # Блокируем пользователей, чтобы параллельные запросы
+            # не создавали одну и ту же строку итогов
+            list(CustomUser.objects.select_for_update().filter(
+                id__in=user_ids).order_by('id').values_list('id'))
+
+            totals = cls.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=deltas)
+            existing = set(totals.values_list('user_id', 'ingredient_id'))
+            totals.update(amount=models.F('amount') + models.Case(
+                *[
+                    models.When(ingredient_id=ingredient_id,
+                                then=models.Value(delta))
+                    for ingredient_id, delta in deltas.items()
+                ],
+                default=models.Value(0),
+                output_field=models.IntegerField()
+            ))
+            cls.objects.bulk_create([
+                cls(user_id=user_id, ingredient_id=ingredient_id,
+                    amount=delta)
+                for user_id in user_ids
+                for ingredient_id, delta in deltas.items()
+                if delta > 0 and (user_id, ingredient_id) not in existing
+            ])
+            totals.filter(amount__lte=0).delete()
+
+    @classmethod
+    def add_recipe(cls, user_id, recipe_id, sign=1):
+        """Учитывает добавление (sign=-1 — удаление) рецепта в корзину."""
+        cls.apply([user_id], {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in cls.recipe_amounts(recipe_id).items()
+        })
+
+
+class StoredFile(models.Model):
+    """Файл хранилища по содержимому (recipes/storage.py)."""
+    name = models.CharField(max_length=255, unique=True, verbose_name='Путь')
+    refs = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
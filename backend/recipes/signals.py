@@ -0,0 +1,270 @@
+"""
+Поддержка денормализованных счетчиков рецептов и пользователей.
+
+Счетчики изменяются выражениями F() в базе данных, поэтому параллельные
+запросы не теряют обновлений, а полное сохранение модели не записывает
+поля счетчиков (models.CountersModel). Обработчики удаления отдельной
+строки обновляют счетчик одним UPDATE; при каскадном удалении рецепта
+или пользователя счетчики за все его строки обновляет обработчик
+pre_delete родителя несколькими запросами, независимо от числа строк.
+Массовые операции (bulk_create, QuerySet.update) сигналов не
+отправляют — после них счетчики пересчитывает команда
+reconcile_counters.
+
+Итоги списков покупок (ShoppingCartTotal) пересчитываются при
+добавлении, изменении и удалении строки корзины, в том числе из админки.
+Удаление рецепта обновляет итоги всех корзин с ним одним пакетом,
+удаление пользователя не трогает итоги вовсе. После массовых
+операций с корзиной итоги пересобирает команда
+rebuild_shopping_cart_totals.
+
+Картинки рецептов и аватары хранятся по содержимому (recipes/storage.py):
+при замене картинки и удалении объекта ссылки на старый файл и его
+копии освобождаются, файл без ссылок удаляется с диска.
+"""
+import threading
+import weakref
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save)
+
+from .images import delete_renditions, release_files, schedule_renditions
+from .models import (
+    CustomUser, FavoriteRecipe, Recipe, ShoppingCart, ShoppingCartTotal,
+    Subscribe)
+
+
+# Строки, для которых Django уже отправил pre_delete, но еще не
+# post_delete. При каскадном удалении pre_delete отправляется сначала
+# всем зависимым строкам, затем родителю, поэтому обработчик родителя
+# обновляет счетчики и итоги сразу за все его строки и помечает их,
+# а post_delete помеченных строк ничего не делает
+_deleting = threading.local()
+
+
+def deleting_rows(model):
+    rows = getattr(_deleting, 'rows', None)
+    if rows is None:
+        rows = _deleting.rows = {}
+    # Строки удаления, завершившегося ошибкой, освобождаются сборщиком
+    return rows.setdefault(model, weakref.WeakValueDictionary())
+
+
+def row_deleting(sender, instance, **kwargs):
+    deleting_rows(sender)[id(instance)] = instance
+
+
+def mark_handled(model, **values):
+    """Помечает удаляемые строки model, учтенные обработчиком родителя."""
+    for instance in list(deleting_rows(model).values()):
+        if all(getattr(instance, field) == value
+               for field, value in values.items()):
+            instance._handled_by_parent = True
+
+
+def handled_by_parent(sender, instance):
+    deleting_rows(sender).pop(id(instance), None)
+    return instance.__dict__.pop('_handled_by_parent', False)
+
+
+def change_counters(model, pk, delta, *fields):
+    model.objects.filter(pk=pk).update(**{
+        field: Greatest(F(field) + delta, 0) for field in fields
+    })
+
+
+def favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counters(Recipe, instance.recipe_id, 1, 'favorites_count')
+
+
+def favorite_deleted(sender, instance, **kwargs):
+    if handled_by_parent(sender, instance):
+        return
+    change_counters(Recipe, instance.recipe_id, -1, 'favorites_count')
+
+
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counters(CustomUser, instance.author_id, 1, 'recipes_count')
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    if handled_by_parent(sender, instance):
+        return
+    change_counters(CustomUser, instance.author_id, -1, 'recipes_count')
+
+
+def subscribe_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counters(
+            CustomUser, instance.user_id, 1, 'subscriptions_count')
+        change_counters(
+            CustomUser, instance.author_id, 1, 'followers_count')
+
+
+def subscribe_deleted(sender, instance, **kwargs):
+    if handled_by_parent(sender, instance):
+        return
+    change_counters(CustomUser, instance.user_id, -1, 'subscriptions_count')
+    change_counters(CustomUser, instance.author_id, -1, 'followers_count')
+
+
+def cart_item_changing(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    # В админке у строки корзины можно сменить рецепт или пользователя
+    instance._saved_cart_item = sender.objects.filter(
+        pk=instance.pk).values_list('user_id', 'recipe_id').first()
+
+
+def cart_item_saved(sender, instance, raw=False, **kwargs):
+    saved = instance.__dict__.pop('_saved_cart_item', None)
+    current = (instance.user_id, instance.recipe_id)
+    if raw or saved == current:
+        return
+    if saved:
+        ShoppingCartTotal.add_recipe(*saved, sign=-1)
+    ShoppingCartTotal.add_recipe(*current)
+
+
+def cart_item_deleted(sender, instance, **kwargs):
+    if handled_by_parent(sender, instance):
+        return
+    ShoppingCartTotal.add_recipe(
+        instance.user_id, instance.recipe_id, sign=-1)
+
+
+def recipe_deleting(sender, instance, **kwargs):
+    # Рецепт уходит из всех корзин одним обновлением итогов, пока его
+    # состав еще не удален каскадом
+    ShoppingCartTotal.apply(
+        ShoppingCart.objects.filter(
+            recipe=instance).values_list('user_id', flat=True),
+        {
+            ingredient_id: -amount
+            for ingredient_id, amount
+            in ShoppingCartTotal.recipe_amounts(instance.pk).items()
+        }
+    )
+    mark_handled(ShoppingCart, recipe_id=instance.pk)
+    # Счетчик избранного удаляется вместе с рецептом
+    mark_handled(FavoriteRecipe, recipe_id=instance.pk)
+
+
+def decrement_counters(model, ids, field):
+    model.objects.filter(id__in=ids).update(
+        **{field: Greatest(F(field) - 1, 0)})
+
+
+def user_deleting(sender, instance, **kwargs):
+    # Каждая пара (пользователь, рецепт) и (подписчик, автор)
+    # уникальна, поэтому счетчик каждой строки уменьшается на 1
+    decrement_counters(
+        Recipe, FavoriteRecipe.objects.filter(
+            user=instance).values('recipe_id'),
+        'favorites_count')
+    decrement_counters(
+        CustomUser, Subscribe.objects.filter(
+            user=instance).values('author_id'),
+        'followers_count')
+    decrement_counters(
+        CustomUser, Subscribe.objects.filter(
+            author=instance).values('user_id'),
+        'subscriptions_count')
+    mark_handled(FavoriteRecipe, user_id=instance.pk)
+    mark_handled(Subscribe, user_id=instance.pk)
+    mark_handled(Subscribe, author_id=instance.pk)
+    # Счетчики и итоги самого пользователя удаляются вместе с ним
+    mark_handled(Recipe, author_id=instance.pk)
+    mark_handled(ShoppingCart, user_id=instance.pk)
+
+
+def image_changing(sender, instance, raw=False, **kwargs):
+    image_field, _ = IMAGE_FIELDS[sender]
+    file = getattr(instance, image_field)
+    if raw or not file or file._committed:
+        return
+    instance._image_uploaded = True
+    # Запрос нужен только при загрузке нового файла взамен старого
+    if instance.pk is not None:
+        instance._replaced_image = sender.objects.filter(
+            pk=instance.pk).values_list(image_field, flat=True).first()
+
+
+def image_saved(sender, instance, created, raw=False, update_fields=None,
+                **kwargs):
+    image_field, renditions_field = IMAGE_FIELDS[sender]
+    file = getattr(instance, image_field)
+    uploaded = instance.__dict__.pop('_image_uploaded', False)
+    # Сохранение файла добавило ссылку, даже если содержимое не изменилось
+    replaced = instance.__dict__.pop('_replaced_image', None)
+    if replaced:
+        release_files(file.storage, [replaced])
+    # Например, обновление last_login картинку не меняет
+    if raw or (update_fields is not None
+               and image_field not in update_fields):
+        return
+    # Копии ставятся в очередь только для новой картинки: недостающие
+    # и неудачные копии прежней не пересоздаются при каждом сохранении
+    # объекта, их создает команда build_image_renditions
+    if file and not (created or uploaded):
+        return
+    schedule_renditions(instance, image_field, renditions_field)
+
+
+def image_deleted(sender, instance, **kwargs):
+    image_field, renditions_field = IMAGE_FIELDS[sender]
+    file = getattr(instance, image_field)
+    release_files(file.storage, [file.name])
+    delete_renditions(file.storage, getattr(instance, renditions_field))
+
+
+# Модель: поле картинки и поле с путями ее уменьшенных копий
+IMAGE_FIELDS = {
+    Recipe: ('image', 'image_renditions'),
+    CustomUser: ('avatar', 'avatar_renditions'),
+}
+
+
+def connect_signals():
+    for model in (FavoriteRecipe, Recipe, Subscribe, ShoppingCart):
+        pre_delete.connect(
+            row_deleting, sender=model,
+            dispatch_uid=f'rows_{model._meta.model_name}_deleting')
+    for model, saved, deleted in (
+        (FavoriteRecipe, favorite_saved, favorite_deleted),
+        (Recipe, recipe_saved, recipe_deleted),
+        (Subscribe, subscribe_saved, subscribe_deleted),
+    ):
+        post_save.connect(
+            saved, sender=model,
+            dispatch_uid=f'counters_{model._meta.model_name}_save')
+        post_delete.connect(
+            deleted, sender=model,
+            dispatch_uid=f'counters_{model._meta.model_name}_delete')
+    pre_save.connect(
+        cart_item_changing, sender=ShoppingCart,
+        dispatch_uid='totals_shoppingcart_change')
+    post_save.connect(
+        cart_item_saved, sender=ShoppingCart,
+        dispatch_uid='totals_shoppingcart_save')
+    post_delete.connect(
+        cart_item_deleted, sender=ShoppingCart,
+        dispatch_uid='totals_shoppingcart_delete')
+    pre_delete.connect(
+        recipe_deleting, sender=Recipe, dispatch_uid='deleting_recipe')
+    pre_delete.connect(
+        user_deleting, sender=CustomUser, dispatch_uid='deleting_customuser')
+    for model in IMAGE_FIELDS:
+        pre_save.connect(
+            image_changing, sender=model,
+            dispatch_uid=f'images_{model._meta.model_name}_change')
+        post_save.connect(
+            image_saved, sender=model,
+            dispatch_uid=f'renditions_{model._meta.model_name}')
+        post_delete.connect(
+            image_deleted, sender=model,
+            dispatch_uid=f'images_{model._meta.model_name}_delete')
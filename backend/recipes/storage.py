@@ -0,0 +1,148 @@
+"""
+Хранилище медиафайлов с именами по содержимому.
+
+Файл сохраняется под именем из SHA-256 его содержимого в каталогах
+по первым символам хеша: recipes_images/ab/cd/abcd...ef.png. Одинаковые
+картинки хранятся один раз, а свободное имя для очередного temp.png
+не подбирается проверками существования файлов.
+
+Число ссылок на файл хранится в таблице StoredFile: сохранение
+увеличивает его, delete() и release() уменьшают. Файл удаляется с
+диска после фиксации транзакции, в которой ссылок не осталось.
+Файлы, сохраненные до перехода на это хранилище, в таблице не
+учтены и не удаляются, пока их не учтет команда collect_media_garbage.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter, defaultdict
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import StoredFile
+
+# Префикс временных файлов, которые еще пишутся
+TEMP_PREFIX = '.upload-'
+
+
+def hashed_name(name, digest):
+    """Имя файла с хешем digest в каталоге, куда сохраняли name."""
+    directory, filename = posixpath.split(name)
+    extension = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        temp_path, digest = self.write_temp(posixpath.dirname(name), content)
+        try:
+            name = hashed_name(name, digest)
+            validate_file_name(name, allow_relative_path=True)
+            with transaction.atomic():
+                # Строка счетчика остается заблокированной до конца
+                # транзакции: collect() не удалит файл, пока он нужен
+                self.acquire(name)
+                full_path = self.path(name)
+                if os.path.exists(full_path):
+                    # Такое содержимое уже есть; свежее время изменения
+                    # защищает файл от сборщика мусора
+                    os.utime(full_path)
+                else:
+                    self.make_directory(os.path.dirname(full_path))
+                    os.replace(temp_path, full_path)
+                    temp_path = None
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+        return name
+
+    def make_directory(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        # os.makedirs() не применяет mode к промежуточным каталогам
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def write_temp(self, directory, content):
+        """
+        Пишет содержимое во временный файл в каталоге directory,
+        одновременно считая хеш. Файл лежит на той же файловой
+        системе, поэтому переносится на место без копирования.
+        """
+        directory = self.path(directory)
+        self.make_directory(directory)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path, digest.hexdigest()
+
+    def acquire(self, name):
+        if StoredFile.objects.filter(name=name).update(refs=F('refs') + 1):
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, refs=1)
+        except IntegrityError:
+            # Строку успели создать в параллельной транзакции
+            StoredFile.objects.filter(name=name).update(refs=F('refs') + 1)
+
+    def release(self, names):
+        """Освобождает по ссылке на каждое имя (имена могут повторяться)."""
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+        groups = defaultdict(list)
+        for name, count in counts.items():
+            groups[count].append(name)
+        with transaction.atomic():
+            for count, group in groups.items():
+                StoredFile.objects.filter(name__in=group).update(
+                    refs=Greatest(F('refs') - count, 0))
+            transaction.on_commit(lambda: self.collect(list(counts)))
+
+    def delete(self, name):
+        self.release([name])
+
+    def collect(self, names):
+        """Удаляет с диска файлы из names, на которые не осталось ссылок."""
+        for name in list(StoredFile.objects.filter(
+            name__in=names, refs=0
+        ).values_list('name', flat=True)):
+            with transaction.atomic():
+                # Блокировка ждет параллельное сохранение того же файла
+                # и перепроверяет, что ссылок по-прежнему нет
+                stored = StoredFile.objects.select_for_update().filter(
+                    name=name, refs=0).first()
+                if stored is None:
+                    continue
+                super().delete(name)
+                stored.delete()
@@ -1,3 +1,628 @@
-# from django.test import TestCase
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from foodgram_api.serializers import RecipeBasicSerializer
+from foodgram_backend.nplusone import NPlusOneTestMixin
+
+from .images import is_current
+from .management.commands.collect_media_garbage import (
+    Command as CollectMediaGarbage)
+from .models import (
+    CustomUser, FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
+    ShoppingCart, ShoppingCartTotal, StoredFile, Subscribe)
+from .storage import ContentAddressedStorage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class AdminNPlusOneTests(NPlusOneTestMixin, TestCase):
+    """Списки админки не должны выполнять запросы в цикле по строкам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(
+            email='admin@example.com', username='admin', password='admin',
+            first_name='Админ', last_name='Админ')
+        authors = [
+            CustomUser.objects.create(
+                email=f'author{i}@example.com', username=f'author{i}',
+                first_name='Автор', last_name=str(i))
+            for i in range(4)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='продукт', measurement_unit='г')
+        for i in range(8):
+            recipe = Recipe.objects.create(
+                author=authors[i % 4], name=f'рецепт {i}',
+                image='recipes_images/test.png', text='текст',
+                cooking_time=10)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1)
+            for author in authors:
+                FavoriteRecipe.objects.create(user=author, recipe=recipe)
+                ShoppingCart.objects.create(user=author, recipe=recipe)
+        for author in authors[1:]:
+            Subscribe.objects.create(user=authors[0], author=author)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists(self):
+        for model in ('recipe', 'customuser', 'ingredient', 'favoriterecipe',
+                      'shoppingcart', 'subscribe'):
+            with self.assertNoNPlusOne():
+                response = self.client.get(f'/admin/recipes/{model}/')
+            self.assertEqual(response.status_code, 200, model)
+
+
+class AdminChangelistQueriesTests(TestCase):
+    """Число запросов списков админки не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(
+            email='admin@example.com', username='admin', password='admin',
+            first_name='Админ', last_name='Админ')
+        cls.author = CustomUser.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        cls.ingredient = Ingredient.objects.create(
+            name='продукт', measurement_unit='г')
+        cls.add_rows(2)
+
+    @classmethod
+    def add_rows(cls, count):
+        """Пользователи с аватаром и по рецепту им и автору cls.author."""
+        for _ in range(count):
+            number = CustomUser.objects.count()
+            user = CustomUser.objects.create(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Пользователь', last_name=str(number),
+                avatar='avatar_images/avatar.png')
+            for author in (cls.author, user):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'рецепт {number}',
+                    image='recipes_images/test.png', text='текст',
+                    cooking_time=10)
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=cls.ingredient, amount=1)
+                FavoriteRecipe.objects.create(user=user, recipe=recipe)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow(self):
+        author_url = f'/admin/recipes/recipe/?author={self.author.email}'
+        urls = (
+            '/admin/recipes/recipe/',
+            author_url,
+            '/admin/recipes/customuser/',
+        )
+        expected = {url: self.count_queries(url) for url in urls}
+        self.add_rows(6)
+        for url in urls:
+            with self.assertNumQueries(expected[url]):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+        response = self.client.get(author_url)
+        self.assertEqual(response.context['cl'].result_count, 8)
+        self.assertContains(
+            self.client.get('/admin/recipes/customuser/'),
+            '/media/avatar_images/avatar.png')
+
+
+class CountersSaveTests(TestCase):
+    """Сохранение объекта не затирает счетчики, измененные сигналами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = [
+            CustomUser.objects.create(
+                email=f'user{i}@example.com', username=f'user{i}',
+                first_name='Пользователь', last_name=str(i))
+            for i in range(2)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='рецепт',
+            image='recipes_images/test.png', text='текст', cooking_time=10)
+
+    def test_save_keeps_counters(self):
+        user = CustomUser.objects.get(pk=self.user.pk)
+        author = CustomUser.objects.get(pk=self.author.pk)
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        Subscribe.objects.create(user=self.user, author=self.author)
+
+        # Объекты загружены до изменения счетчиков
+        user.first_name = 'Новое имя'
+        user.save()
+        author.save()
+        recipe.name = 'новое название'
+        recipe.save()
+
+        user.refresh_from_db()
+        author.refresh_from_db()
+        recipe.refresh_from_db()
+        self.assertEqual(user.first_name, 'Новое имя')
+        self.assertEqual(user.subscriptions_count, 1)
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 1)
+        self.assertEqual(recipe.name, 'новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_counters_saved_when_listed(self):
+        self.recipe.favorites_count = 5
+        self.recipe.save(update_fields=['favorites_count'])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 5)
+
+
+class CountersDeletionTests(TestCase):
+    """Счетчики при удалении строк, в том числе каскадном."""
+
+    numbers = itertools.count()
+
+    def create_user(self):
+        number = next(self.numbers)
+        return CustomUser.objects.create(
+            email=f'user{number}@example.com', username=f'user{number}',
+            first_name='Пользователь', last_name=str(number))
+
+    def create_recipe(self, author):
+        return Recipe.objects.create(
+            author=author, name='рецепт',
+            image='recipes_images/test.png', text='текст', cooking_time=10)
+
+    def check_counters(self):
+        call_command('reconcile_counters', '--check', stdout=io.StringIO())
+
+    def test_row_deletion(self):
+        user, author = self.create_user(), self.create_user()
+        recipe = self.create_recipe(author)
+        FavoriteRecipe.objects.create(user=user, recipe=recipe)
+        Subscribe.objects.create(user=user, author=author)
+        FavoriteRecipe.objects.get(user=user).delete()
+        Subscribe.objects.get(user=user).delete()
+        self.check_counters()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(author.followers_count, 0)
+
+    def test_recipe_deletion(self):
+        author = self.create_user()
+        recipe, kept = self.create_recipe(author), self.create_recipe(author)
+        for _ in range(3):
+            user = self.create_user()
+            FavoriteRecipe.objects.create(user=user, recipe=recipe)
+            FavoriteRecipe.objects.create(user=user, recipe=kept)
+        recipe.delete()
+        self.check_counters()
+        author.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertEqual(author.recipes_count, 1)
+        self.assertEqual(kept.favorites_count, 3)
+
+    def test_user_deletion_in_constant_queries(self):
+        queries = []
+        for count in (1, 4):
+            user = self.create_user()
+            self.create_recipe(user)
+            for _ in range(count):
+                other = self.create_user()
+                FavoriteRecipe.objects.create(
+                    user=user, recipe=self.create_recipe(other))
+                FavoriteRecipe.objects.create(
+                    user=other, recipe=self.create_recipe(other))
+                Subscribe.objects.create(user=user, author=other)
+                Subscribe.objects.create(user=other, author=user)
+            with CaptureQueriesContext(connection) as context:
+                user.delete()
+            queries.append(len(context.captured_queries))
+            self.check_counters()
+        self.assertEqual(queries[0], queries[1])
+        self.assertFalse(Recipe.objects.filter(favorites_count__gt=1).exists())
+        self.assertFalse(CustomUser.objects.exclude(
+            followers_count=0, subscriptions_count=0).exists())
+
+    def test_reconcile_command(self):
+        user, author = self.create_user(), self.create_user()
+        recipe = self.create_recipe(author)
+        FavoriteRecipe.objects.create(user=user, recipe=recipe)
+        Subscribe.objects.create(user=user, author=author)
+        self.check_counters()
+
+        # Массовые операции сигналов не отправляют
+        Recipe.objects.update(favorites_count=5)
+        CustomUser.objects.filter(pk=author.pk).update(followers_count=0)
+        with self.assertRaisesMessage(CommandError,
+                                      'Расхождений в счетчиках: 2'):
+            self.check_counters()
+
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.check_counters()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(author.followers_count, 1)
+
+
+class ShoppingCartTotalsTests(TestCase):
+    """Итоги списка покупок следуют за корзиной при изменениях через ORM."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            email='user@example.com', username='user',
+            first_name='Пользователь', last_name='Пользователев')
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г')
+        cls.recipes = []
+        for i, amounts in enumerate(({'salt': 5, 'sugar': 10}, {'salt': 3})):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'рецепт {i}',
+                image='recipes_images/test.png', text='текст',
+                cooking_time=10)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe,
+                                 ingredient=getattr(cls, name), amount=amount)
+                for name, amount in amounts.items())
+            cls.recipes.append(recipe)
+
+    def totals(self):
+        return dict(self.user.shopping_cart_totals.values_list(
+            'ingredient__name', 'amount'))
+
+    def test_totals_follow_cart_rows(self):
+        first, second = self.recipes
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.assertEqual(self.totals(), {'соль': 8, 'сахар': 10})
+
+        ShoppingCart.objects.filter(user=self.user, recipe=first).delete()
+        self.assertEqual(self.totals(), {'соль': 3})
+
+        # Смена рецепта в существующей строке, как в админке
+        cart_item = ShoppingCart.objects.get(user=self.user)
+        cart_item.recipe = first
+        cart_item.save()
+        self.assertEqual(self.totals(), {'соль': 5, 'сахар': 10})
+
+        # Каскадное удаление: состав рецепта удаляется раньше корзины
+        first.delete()
+        self.assertEqual(self.totals(), {})
+
+    def add_to_carts(self, recipe, count):
+        """Новые пользователи, добавившие recipe в корзину."""
+        users = []
+        for _ in range(count):
+            number = CustomUser.objects.count()
+            user = CustomUser.objects.create(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='Пользователь', last_name=str(number))
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+            users.append(user)
+        return users
+
+    def test_recipe_deletion_updates_carts_in_one_batch(self):
+        first, second = self.recipes
+        ShoppingCart.objects.create(user=self.user, recipe=second)
+        queries = []
+        for recipe, count in ((first, 1), (second, 4)):
+            users = self.add_to_carts(recipe, count)
+            with CaptureQueriesContext(connection) as context:
+                recipe.delete()
+            queries.append(len(context.captured_queries))
+            for user in users:
+                self.assertFalse(user.shopping_cart_totals.exists())
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(self.totals(), {})
+
+    def test_user_deletion(self):
+        first, second = self.recipes
+        other, = self.add_to_carts(first, 1)
+        ShoppingCart.objects.create(user=other, recipe=second)
+        ShoppingCart.objects.create(user=self.user, recipe=first)
+        other.delete()
+        self.assertEqual(self.totals(), {'соль': 5, 'сахар': 10})
+
+        # Вместе с автором удаляются его рецепты в чужих корзинах
+        reader, = self.add_to_carts(second, 1)
+        self.user.delete()
+        self.assertFalse(reader.shopping_cart_totals.exists())
+        self.assertFalse(ShoppingCartTotal.objects.exists())
+
+    def test_rebuild_command(self):
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        call_command('rebuild_shopping_cart_totals', '--check',
+                     stdout=io.StringIO())
+
+        # Массовые операции сигналов не отправляют
+        ShoppingCartTotal.objects.filter(
+            ingredient=self.salt).update(amount=1)
+        ShoppingCartTotal.objects.filter(ingredient=self.sugar).delete()
+        with self.assertRaisesMessage(CommandError, 'Расхождений в итогах: 2'):
+            call_command('rebuild_shopping_cart_totals', '--check',
+                         stdout=io.StringIO())
+
+        call_command('rebuild_shopping_cart_totals', '--batch-size', '1',
+                     stdout=io.StringIO())
+        self.assertEqual(self.totals(), {'соль': 8, 'сахар': 10})
+        call_command('rebuild_shopping_cart_totals', '--check',
+                     stdout=io.StringIO())
+
+
+class ImportIngredientsTests(TestCase):
+    INGREDIENTS = [('соль', 'г'), ('сахар', 'г'), ('молоко', 'мл')]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def write_json(self, rows):
+        return self.write('ingredients.json', json.dumps(
+            [{'name': name, 'measurement_unit': unit} for name, unit in rows],
+            ensure_ascii=False))
+
+    def write_csv(self, rows):
+        return self.write('ingredients.csv', ''.join(
+            f'{name},{unit}\n' for name, unit in rows))
+
+    def import_file(self, path, *args):
+        stdout = io.StringIO()
+        call_command('import_ingredients', path, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def ingredients(self):
+        return sorted(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+
+    def test_formats(self):
+        for write in (self.write_json, self.write_csv):
+            with self.subTest(write.__name__):
+                Ingredient.objects.all().delete()
+                output = self.import_file(write(self.INGREDIENTS))
+                self.assertIn('Добавлено: 3', output)
+                self.assertEqual(self.ingredients(),
+                                 sorted(self.INGREDIENTS))
+
+    def test_rerun_skips_existing(self):
+        path = self.write_csv(self.INGREDIENTS)
+        self.import_file(path)
+        self.write_csv(self.INGREDIENTS + [('мука', 'г')])
+        output = self.import_file(path)
+        self.assertIn('Добавлено: 1, пропущено (уже есть): 3', output)
+        self.assertEqual(Ingredient.objects.count(), 4)
+
+    def test_small_batches_and_chunks(self):
+        rows = [(f'продукт {i}', 'г') for i in range(25)]
+        path = self.write_json(rows)
+        # Объекты JSON пересекают границы блоков чтения
+        with mock.patch(
+                'recipes.management.commands.import_ingredients.'
+                'READ_CHUNK_SIZE', 16):
+            output = self.import_file(path, '--batch-size', '4')
+        self.assertIn('Добавлено: 25', output)
+        self.assertEqual(self.ingredients(), sorted(rows))
+
+    def test_malformed_input(self):
+        for name, content in (
+            ('broken.json', '[{"name": "соль", "measurement_unit": "г"}'),
+            ('object.json', '{"name": "соль"}'),
+            ('no_unit.json', '[{"name": "соль"}]'),
+            ('columns.csv', 'соль,г,лишнее\n'),
+            ('empty_field.csv', 'соль,\n'),
+            ('ingredients.xml', '<ingredients/>'),
+        ):
+            with self.subTest(name):
+                with self.assertRaises(CommandError):
+                    self.import_file(self.write(name, content))
+        self.assertFalse(Ingredient.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RenditionsScheduleTests(TestCase):
+    """Копии создаются для новой картинки, а не при каждом сохранении."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        author = CustomUser.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        self.recipe = Recipe.objects.create(
+            author=author, name='рецепт', image='recipes_images/test.png',
+            text='текст', cooking_time=10)
+
+    def count_scheduled(self, **changes):
+        """Сколько задач создания копий поставило сохранение рецепта."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            for field, value in changes.items():
+                setattr(self.recipe, field, value)
+            self.recipe.save()
+        return sum(
+            callback.__qualname__.startswith('schedule_renditions.')
+            for callback in callbacks)
+
+    def test_renditions_are_not_retried_on_save(self):
+        # Копии прежней картинки еще не готовы или их создание не удалось
+        self.assertEqual(self.count_scheduled(name='новое название'), 0)
+        self.assertEqual(self.count_scheduled(
+            image=ContentFile(b'image', name='new.png')), 1)
+        self.assertEqual(self.count_scheduled(), 0)
+
+
+def png_file(width, height, name='image.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_RENDITION_WORKERS=0)
+class RenditionsOutputTests(TestCase):
+    """Копии картинки в ответах API и их создание командой."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = CustomUser.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов')
+        # Исходная картинка уже 1200 пикселей: копия full не создается
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='рецепт', image=png_file(1000, 500),
+            text='текст', cooking_time=10)
+
+    def test_srcset_in_api(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        srcset = response.json()['image_srcset']
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        for extension, value in srcset.items():
+            candidates = [item.split(' ') for item in value.split(', ')]
+            self.assertEqual(
+                [width for _, width in candidates],
+                ['240w', '600w', '1000w'])
+            for url, _ in candidates:
+                self.assertTrue(url.startswith('http://testserver/media/'))
+                self.assertTrue(url.endswith(f'.{extension}'))
+
+    def test_basic_serializer_uses_smallest_jpeg(self):
+        thumbnail = self.recipe.image_renditions['thumbnail']['jpeg']
+        self.assertEqual(
+            RecipeBasicSerializer(self.recipe).data['image'],
+            self.recipe.image.storage.url(thumbnail))
+
+        # Копии устарели или еще не созданы — исходная картинка
+        self.recipe.image_renditions = {}
+        data = RecipeBasicSerializer(self.recipe).data
+        self.assertEqual(data['image'], self.recipe.image.url)
+        self.assertIsNone(data['image_srcset'])
+
+    def test_build_command(self):
+        # Картинки без копий, как до появления сигналов
+        Recipe.objects.update(image_renditions={})
+        CustomUser.objects.filter(pk=self.author.pk).update(
+            avatar=self.recipe.image.storage.save(
+                'avatar_images/avatar.png', png_file(100, 100)))
+        output = io.StringIO()
+        call_command('build_image_renditions', workers=0, stdout=output)
+        self.assertIn('Картинок для обработки: 2', output.getvalue())
+
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertTrue(is_current(
+            self.recipe.image.name, self.recipe.image_renditions))
+        self.assertTrue(is_current(
+            self.author.avatar.name, self.author.avatar_renditions))
+        # Картинка меньше самой маленькой копии не увеличивается
+        self.assertEqual(
+            self.author.avatar_renditions['thumbnail']['width'], 100)
+        self.assertNotIn('card', self.author.avatar_renditions)
+
+        output = io.StringIO()
+        call_command('build_image_renditions', workers=0, stdout=output)
+        self.assertIn('Картинок для обработки: 0', output.getvalue())
+
+
+class ContentAddressedStorageTests(TransactionTestCase):
+    """Файлы удаляются после фиксации транзакции, нужен TransactionTestCase."""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_identical_files_are_stored_once(self):
+        first = self.storage.save('recipes_images/temp.png',
+                                  ContentFile(b'image'))
+        second = self.storage.save('recipes_images/temp.PNG',
+                                   ContentFile(b'image'))
+        other = self.storage.save('recipes_images/temp.png',
+                                  ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(
+            first, r'^recipes_images/([0-9a-f]{2})/([0-9a-f]{2})/\1\2'
+                   r'[0-9a-f]{60}\.png$')
+        self.assertEqual(StoredFile.objects.get(name=first).refs, 2)
+        self.assertEqual(
+            sorted(os.listdir(self.storage.path('recipes_images'))),
+            sorted([first.split('/')[1], other.split('/')[1]]))
+
+    def test_file_is_deleted_with_last_reference(self):
+        name = self.storage.save('avatar_images/temp.png',
+                                 ContentFile(b'image'))
+        self.storage.save('avatar_images/temp.png', ContentFile(b'image'))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_unknown_files_are_not_deleted(self):
+        # Файлы, сохраненные до перехода на хранилище по содержимому
+        path = self.storage.path('recipes_images/old.png')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(b'image')
+        self.storage.delete('recipes_images/old.png')
+        self.assertTrue(os.path.exists(path))
+
+
+class CollectMediaGarbageTests(TestCase):
+
+    def test_refs_changed_during_scan_are_kept(self):
+        StoredFile.objects.bulk_create(
+            StoredFile(name=name, refs=refs)
+            for name, refs in (('changed', 2), ('counted', 1),
+                               ('missing', 1)))
+        # Ссылки до подсчета; 'deleted' удалили во время подсчета
+        snapshot = {'changed': 1, 'counted': 1, 'missing': 1, 'deleted': 1}
+        references = Counter(changed=1, counted=3, deleted=1, new=2)
+        storage = ContentAddressedStorage(location=MEDIA_ROOT)
+
+        skipped = CollectMediaGarbage.update_refs(
+            storage, references, set(references), snapshot)
+
+        self.assertEqual(skipped, 2)
+        self.assertEqual(
+            dict(StoredFile.objects.values_list('name', 'refs')),
+            {'changed': 2, 'counted': 3, 'new': 2})